@@ -9,15 +9,12 @@
 # - Shortcuts > for easier and faster workflow
 # - Addon preferences so shortcuts can be customized
 # - Panel feedback when nothings is selected or wrong object
+# - Auto update when working on posing > opt-in, updates shortly after the keys are edited
 
 # Fixed
 # - Possibly old onion skinning when another file is openened
 # - Linked rigs and local object/mesh also show onion skinning
 
-# Ideas
-# - Auto update when working on posing > could be handy? > need fedback from real animators
-# - Added option to do multiple objects > this would need merge of objects, not sure will still work properly
-
 ##################
 ## Initiation
 ##################
@@ -91,12 +88,14 @@ class ANMX_AddonPreferences(AddonPreferences):
 
 
 addon_keymaps = []
-classes = [ANMX_gui, ANMX_data, ANMX_set_onion, ANMX_draw_meshes, ANMX_clear_onion, ANMX_toggle_onion, ANMX_update_onion, ANMX_add_clear_onion, ANMX_AddonPreferences]
+classes = [ANMX_gui, ANMX_object, ANMX_data, ANMX_set_onion, ANMX_draw_meshes, ANMX_clear_onion, ANMX_toggle_onion, ANMX_update_onion, ANMX_add_clear_onion, ANMX_add_onion_objects, ANMX_remove_onion_object, ANMX_cancel_bake, ANMX_dump_perf, ANMX_AddonPreferences]
 
 
 @persistent
 def ANMX_clear_handler(scene):
     ops.clear_active(clrRig=False)
+    ops.clear_stash()
+    ops.vertex_weights.clear()
     # bpy.ops.anim_extras.draw_meshes('INVOKE_DEFAULT')
 
 def register():
@@ -105,19 +104,29 @@ def register():
     
     bpy.types.Scene.anmx_data = bpy.props.PointerProperty(type=ANMX_data)
     bpy.app.handlers.load_pre.append(ANMX_clear_handler)
+    bpy.app.handlers.frame_change_post.append(ops.ANMX_window_handler)
+    bpy.app.handlers.render_init.append(ops.ANMX_render_start)
+    bpy.app.handlers.render_complete.append(ops.ANMX_render_end)
+    bpy.app.handlers.render_cancel.append(ops.ANMX_render_end)
+    bpy.app.handlers.depsgraph_update_post.append(ops.ANMX_key_handler)
+    bpy.app.handlers.depsgraph_update_post.append(ops.ANMX_auto_handler)
+    bpy.app.handlers.undo_post.append(ops.ANMX_undo_handler)
+    bpy.app.handlers.redo_post.append(ops.ANMX_undo_handler)
     
+    # Background Blender (blender -b, the command line bake and the bench) has no add-on keyconfig
     wm = bpy.context.window_manager
     kc = wm.keyconfigs.addon
-    km = kc.keymaps.new(name="3D View", space_type="VIEW_3D")
+    if kc:
+        km = kc.keymaps.new(name="3D View", space_type="VIEW_3D")
 
-    kmi = km.keymap_items.new("anim_extras.update_onion", "R", "PRESS", alt = True, shift = True)
-    addon_keymaps.append((km, kmi))
-    
-    kmi = km.keymap_items.new("anim_extras.toggle_onion", "T", "PRESS", alt = True, shift = True)
-    addon_keymaps.append((km, kmi))
-    
-    kmi = km.keymap_items.new("anim_extras.add_clear_onion", "C", "PRESS", alt = True, shift = True)
-    addon_keymaps.append((km, kmi))
+        kmi = km.keymap_items.new("anim_extras.update_onion", "R", "PRESS", alt = True, shift = True)
+        addon_keymaps.append((km, kmi))
+
+        kmi = km.keymap_items.new("anim_extras.toggle_onion", "T", "PRESS", alt = True, shift = True)
+        addon_keymaps.append((km, kmi))
+
+        kmi = km.keymap_items.new("anim_extras.add_clear_onion", "C", "PRESS", alt = True, shift = True)
+        addon_keymaps.append((km, kmi))
 
 
 def unregister():
@@ -125,6 +134,16 @@ def unregister():
         bpy.utils.unregister_class(c)
     
     bpy.app.handlers.load_pre.remove(ANMX_clear_handler)
+    bpy.app.handlers.frame_change_post.remove(ops.ANMX_window_handler)
+    bpy.app.handlers.render_init.remove(ops.ANMX_render_start)
+    bpy.app.handlers.render_complete.remove(ops.ANMX_render_end)
+    bpy.app.handlers.render_cancel.remove(ops.ANMX_render_end)
+    bpy.app.handlers.depsgraph_update_post.remove(ops.ANMX_key_handler)
+    bpy.app.handlers.depsgraph_update_post.remove(ops.ANMX_auto_handler)
+    bpy.app.handlers.undo_post.remove(ops.ANMX_undo_handler)
+    bpy.app.handlers.redo_post.remove(ops.ANMX_undo_handler)
+    ops.cancel_auto()
+    ops.clear_stash()
 
     for km, kmi in addon_keymaps:
         km.keymap_items.remove(kmi)
@@ -0,0 +1,268 @@
+###########################
+## Onion Skinning Benchmark
+###########################
+
+# Times the bake and draw pipeline on synthetic animated meshes of several sizes in every onion mode and
+# compares the results against a stored baseline. It runs the add-on's pipeline, from bake_frames through
+# make_batches to draw_ghosts, the meshes are evaluated by Blender and drawn into an offscreen:
+#     blender -b --factory-startup --python-expr "import animextras.ons.bench as b; b.main()" -- --baseline bench.json
+# tools/bench_plain.py runs the same cases with plain Python on the bpy and gpu stand-ins of tools/standin.py,
+# it is not part of the add-on.
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+from contextlib import contextmanager
+
+import numpy as np
+
+from .cli import ensure_addon
+
+sizes = [1000, 10000, 100000]
+modes = ["PF", "PFS", "DC", "INB"]
+frame_count = 100
+key_step = 10
+skin_step = 2
+
+# Relative slowdown or memory growth that counts as a regression
+threshold = 0.5
+
+# Phases faster than this are too noisy to compare
+min_time = 0.005
+
+# Times a phase is repeated in the draw benchmark
+draw_repeats = 20
+
+# Times every case is run, the fastest run of each phase is kept
+repeats = 3
+
+
+class Recorder:
+    """ Collects the time of named phases of a benchmark case """
+
+    def __init__(self):
+        self.phases = dict([])
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        yield
+        self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+
+def measure(case, count=repeats):
+    """ Runs case(recorder) once traced for the peak memory, NumPy arrays included, and count times untraced for the fastest phase times """
+    tracemalloc.start()
+    try:
+        case(Recorder())
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    phases = dict([])
+    for i in range(count):
+        rec = Recorder()
+        case(rec)
+        for name, seconds in rec.phases.items():
+            phases[name] = min(seconds, phases.get(name, seconds))
+
+    return {"phases": phases, "peak": peak}
+
+
+def make_grid(count):
+    """ Flat grid of about count vertices and its triangles """
+    side = max(2, int(round(count ** 0.5)))
+    u, v = np.meshgrid(np.linspace(-1, 1, side, dtype='f'), np.linspace(-1, 1, side, dtype='f'))
+    vertices = np.stack([u.ravel(), v.ravel(), np.zeros(side * side, 'f')], axis=1)
+
+    quads = (np.arange(side - 1)[None, :] + np.arange(side - 1)[:, None] * side).ravel()
+    indices = np.concatenate([
+        np.stack([quads, quads + 1, quads + side], axis=1),
+        np.stack([quads + 1, quads + side + 1, quads + side], axis=1),
+        ]).astype('i')
+    return vertices, indices, side
+
+
+def make_bones(vertices):
+    """ Two bones along x with weights blending over the grid, pose matrices rotate the second bone """
+    weights = (vertices[:, 0] + 1) / 2
+    influences = [[(0, 1 - w), (1, w)] for w in weights.tolist()]
+    rest_inv = np.stack([np.identity(4, 'f')] * 2)
+    return influences, rest_inv
+
+
+def bone_pose(frame):
+    angle = np.sin(frame * 0.1) * 0.5
+    second = np.identity(4, 'f')
+    second[:2, :2] = [[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]]
+    return np.stack([np.identity(4, 'f'), second])
+
+
+def make_blender_object(size, frames_total):
+    """ Grid object with keyed location and a wave modifier, so every frame has to be evaluated """
+    import bpy
+
+    base, indices, side = make_grid(size)
+    mesh = bpy.data.meshes.new("anmx_bench")
+    mesh.from_pydata(base.tolist(), [], indices.tolist())
+    obj = bpy.data.objects.new("anmx_bench", mesh)
+    bpy.context.scene.collection.objects.link(obj)
+    obj.modifiers.new("Wave", 'WAVE')
+
+    for f in range(1, frames_total + 1, key_step):
+        obj.location.x = f * 0.01
+        obj.keyframe_insert("location", index=0, frame=f)
+    return obj
+
+
+def remove_blender_object(obj):
+    import bpy
+
+    mesh = obj.data
+    action = obj.animation_data.action
+    bpy.data.objects.remove(obj)
+    bpy.data.meshes.remove(mesh)
+    bpy.data.actions.remove(action)
+
+
+def run_pipeline(rec, size, mode, frames_total):
+    """ Runs the add-on pipeline on one mesh size and onion mode, stages that need a GPU are skipped without one.
+    Returns the baked frames as frame: [vertices, indices] """
+    import bpy
+    import gpu
+    from mathutils import Matrix
+    from . import ops
+
+    scn = bpy.context.scene
+    anmx = scn.anmx_data
+    obj = make_blender_object(size, frames_total)
+
+    anmx.onion_object = obj.name
+    anmx.onion_mode = mode
+    anmx.skin_step = skin_step
+
+    # Ghosts as far as the keys are apart, so the stepped and key modes have ghosts to draw too
+    anmx.skin_count = key_step
+    ops.draw_data.pop("colors", None)
+    for name in ["bake_window", "background_bake", "parallel_bake", "use_disk_cache", "auto_update"]:
+        setattr(anmx, name, False)
+
+    try:
+        ops.clear_data()
+        with rec.phase("bake"):
+            ops.bake_frames()
+        baked = dict((int(key), [ops.frame_vertices(arg), arg[1]]) for key, arg in ops.frame_data.items())
+
+        try:
+            with rec.phase("batches"):
+                ops.make_batches()
+
+            offscreen = gpu.types.GPUOffScreen(512, 512)
+            scn.frame_current = int(ops.batch_frames()[len(ops.batch_frames()) // 2])
+            with offscreen.bind():
+                gpu.matrix.load_matrix(Matrix.Identity(4))
+                gpu.matrix.load_projection_matrix(Matrix.Identity(4))
+                with rec.phase("draw"):
+                    for i in range(draw_repeats):
+                        ops.draw_ghosts(scn)
+            offscreen.free()
+            rec.phases["draw"] /= draw_repeats
+        except (SystemError, RuntimeError, ValueError) as e:
+            # Background Blender may have no GPU context
+            rec.phases.pop("batches", None)
+            rec.phases.pop("draw", None)
+            print("Skipping GPU stages: {}".format(e))
+    finally:
+        ops.clear_data()
+        anmx.onion_object = ""
+        remove_blender_object(obj)
+
+    return baked
+
+
+def run_case(rec, size, mode, frames_total, folder):
+    run_pipeline(rec, size, mode, frames_total)
+
+
+def run(case_sizes, case_modes, frames_total, case=run_case):
+    """ Runs every case, returns a dict of case name: phase times and peak memory.
+    case(recorder, size, mode, frames_total, folder) runs one, folder is a temporary folder it may write to """
+    results = dict([])
+    folder = tempfile.mkdtemp(prefix="anmx_bench_")
+
+    try:
+        for size in case_sizes:
+            for mode in case_modes:
+                name = "grid_{}_{}".format(size, mode)
+                results[name] = measure(lambda rec: case(rec, size, mode, frames_total, folder))
+                print(format_result(name, results[name]))
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    return results
+
+
+def format_result(name, result):
+    phases = "  ".join("{} {:.1f}ms".format(k, v * 1000) for k, v in result["phases"].items())
+    return "{:<20} peak {:7.1f} MB  {}".format(name, result["peak"] / 2**20, phases)
+
+
+def compare(results, baseline, limit=threshold):
+    """ Returns the regressions of results against the baseline, phases or cases missing from either are not compared """
+    regressions = []
+
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+
+        for phase, seconds in result["phases"].items():
+            before = base["phases"].get(phase)
+            if before is None or max(before, seconds) < min_time:
+                continue
+            if seconds > before * (1 + limit):
+                regressions.append("{} {}: {:.1f}ms -> {:.1f}ms".format(name, phase, before * 1000, seconds * 1000))
+
+        if base["peak"] and result["peak"] > base["peak"] * (1 + limit):
+            regressions.append("{} peak: {:.1f} MB -> {:.1f} MB".format(name, base["peak"] / 2**20, result["peak"] / 2**20))
+
+    return regressions
+
+
+def main(argv=None, prog="ons.bench", setup=ensure_addon, case=run_case):
+    """ Command line entry, exits with 1 when results regressed against the baseline. setup makes the add-on usable before the cases run """
+    if argv is None:
+        argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]
+
+    parser = argparse.ArgumentParser(prog=prog, description="Benchmarks the onion skin bake and draw pipeline")
+    parser.add_argument("--sizes", type=int, nargs="+", default=sizes, help="vertex counts of the synthetic meshes")
+    parser.add_argument("--modes", nargs="+", default=modes, choices=modes, help="onion modes to bake")
+    parser.add_argument("--frames", type=int, default=frame_count, help="length of the animation")
+    parser.add_argument("--save", help="write the results as a new baseline")
+    parser.add_argument("--baseline", help="compare the results against this baseline")
+    parser.add_argument("--threshold", type=float, default=threshold, help="relative slowdown that fails the run")
+    args = parser.parse_args(argv)
+
+    setup()
+    results = run(args.sizes, args.modes, args.frames, case)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=1)
+
+    if args.baseline and os.path.isfile(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for line in regressions:
+            print("Regression: " + line)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
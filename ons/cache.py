@@ -0,0 +1,123 @@
+###########################
+## Onion Skinning Cache
+###########################
+
+# On disk cache of baked frames. Every entry is a folder holding all vertices in one .npy, the distinct
+# index arrays in another and a manifest, so loading is a memory map rather than a read.
+# Kept free of bpy, the add-on passes in what makes up the key.
+
+import os
+import json
+import shutil
+import hashlib
+
+import numpy as np
+
+# Bumped when the layout of an entry changes so old entries are not read
+version = 1
+
+
+def make_key(parts):
+    """ Hashes strings, numbers and arrays into a cache key """
+    h = hashlib.sha1()
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            h.update(str(part.shape).encode())
+            h.update(np.ascontiguousarray(part).tobytes())
+        else:
+            h.update(repr(part).encode())
+        h.update(b"|")
+    return h.hexdigest()
+
+
+def safe_name(name):
+    return "".join(c if c.isalnum() or c in "-_" else "_" for c in name)
+
+
+def entry_path(folder, name, key):
+    return os.path.join(folder, "{}.{}".format(safe_name(name), key[:20]))
+
+
+def exists(folder, name, key):
+    return os.path.isfile(os.path.join(entry_path(folder, name, key), "manifest.json"))
+
+
+def save(folder, name, key, frames):
+    """ Writes frames, a dict of frame: [vertices, indices], as the entry for the key and drops older entries of name """
+    # An existing entry is complete already and may be mapped, it must not be written over
+    if exists(folder, name, key):
+        return
+
+    path = entry_path(folder, name, key)
+    os.makedirs(path, exist_ok=True)
+
+    keys = sorted(frames)
+
+    # Frames sharing one index array store it once
+    distinct = []
+    refs = []
+    for f in keys:
+        indices = frames[f][1]
+        for i, other in enumerate(distinct):
+            if other is indices or (other.shape == indices.shape and np.array_equal(other, indices)):
+                refs.append(i)
+                break
+        else:
+            refs.append(len(distinct))
+            distinct.append(indices)
+
+    manifest = {
+        "version": version,
+        "key": key,
+        "frames": [int(f) for f in keys],
+        "vertex_counts": [len(frames[f][0]) for f in keys],
+        "index_refs": refs,
+        "index_counts": [len(i) for i in distinct],
+        }
+
+    np.save(os.path.join(path, "vertices.npy"), np.concatenate([frames[f][0] for f in keys]).astype('f'))
+    np.save(os.path.join(path, "indices.npy"), np.concatenate(distinct).astype('i'))
+
+    # Manifest is written last, an entry without one is incomplete
+    with open(os.path.join(path, "manifest.json"), "w") as f:
+        json.dump(manifest, f)
+
+    prune(folder, name, path)
+
+
+def load(folder, name, key):
+    """ Maps the entry for the key, returns a dict of frame: [vertices, indices] or None when there is no valid entry """
+    path = entry_path(folder, name, key)
+    try:
+        with open(os.path.join(path, "manifest.json")) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if manifest.get("version") != version or manifest.get("key") != key:
+        return None
+
+    vertices = np.load(os.path.join(path, "vertices.npy"), mmap_mode='r')
+    indices = np.load(os.path.join(path, "indices.npy"), mmap_mode='r')
+
+    distinct = []
+    start = 0
+    for count in manifest["index_counts"]:
+        distinct.append(indices[start:start + count])
+        start += count
+
+    frames = dict([])
+    start = 0
+    for f, count, ref in zip(manifest["frames"], manifest["vertex_counts"], manifest["index_refs"]):
+        frames[f] = [vertices[start:start + count], distinct[ref]]
+        start += count
+    return frames
+
+
+def prune(folder, name, keep):
+    """ Removes the entries of name other than keep, they belong to older versions of the animation """
+    prefix = safe_name(name) + "."
+    for entry in os.listdir(folder):
+        path = os.path.join(folder, entry)
+        if entry.startswith(prefix) and path != keep and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
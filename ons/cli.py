@@ -0,0 +1,112 @@
+###########################
+## Onion Skinning CLI
+###########################
+
+# Bakes onion skins without a viewport and writes them to the disk cache next to the .blend file, where the
+# add-on finds them once the object is set as onion object with Disk Cache on. Shots can be pre-baked on farm machines:
+#     blender -b shot.blend --python-expr "import animextras.ons.cli as c; c.main()" -- --objects Body --modes PF DC
+# The add-on has to be installed as animextras, or be on sys.path, it is registered when Blender started without it.
+
+import sys
+import argparse
+import importlib
+
+modes = ["PF", "PFS", "DC", "INB"]
+
+
+def ensure_addon():
+    """ Registers the add-on when Blender was started without it, baking needs its properties """
+    import bpy
+
+    if not hasattr(bpy.types.Scene, "anmx_data"):
+        importlib.import_module(__package__.rpartition(".")[0]).register()
+
+
+def parse_range(text):
+    """ Parses "start-end" into an inclusive range of frames """
+    start, _, end = text.partition("-")
+    return int(start), int(end or start)
+
+
+def bake_object(name, mode, step=None, frame_range=None, extras=(), workers=0):
+    """ Bakes the object in the mode into the disk cache, returns the number of frames written """
+    import bpy
+    from . import ops
+
+    scn = bpy.context.scene
+    anmx = scn.anmx_data
+    _obj = bpy.data.objects.get(name)
+    if _obj is None:
+        raise ValueError("No object named {}".format(name))
+
+    anmx.onion_object = name
+    anmx.onion_mode = mode
+    if step is not None:
+        anmx.skin_step = step
+    anmx.extra_objects.clear()
+    for extra in extras:
+        anmx.extra_objects.add().name = extra
+
+    # Every frame is baked at full precision in one go, the add-on packs them as it loads the entry
+    anmx.store_precision = "FULL"
+    anmx.bake_window = False
+    anmx.background_bake = False
+    anmx.auto_update = False
+    anmx.use_disk_cache = True
+    anmx.parallel_bake = workers > 1
+    if workers > 1:
+        anmx.bake_workers = workers
+
+    if not ops.use_cache(_obj):
+        raise ValueError("{} can't be cached, only meshes in a saved file that are not baked by the transform fast path are".format(name))
+
+    ops.clear_data()
+    try:
+        frames = ops.mode_frames(anmx, ops.get_keyframes(_obj))
+        if frame_range is not None:
+            frames = [f for f in frames if frame_range[0] <= f <= frame_range[1]]
+
+        count = ops.worker_count(_obj, frames)
+        if count:
+            ops.bake_workers(_obj, frames, count=count)
+        else:
+            ops.bake_list(_obj, frames)
+
+        ops.save_cache(_obj)
+        return len(frames)
+    finally:
+        ops.clear_data()
+
+
+def bake(names, bake_modes=("PF",), step=None, frame_range=None, extras=(), workers=0):
+    """ Bakes every named object in every mode, returns a dict of (name, mode): frames written """
+    ensure_addon()
+
+    written = dict([])
+    for name in names:
+        for mode in bake_modes:
+            written[(name, mode)] = bake_object(name, mode, step, frame_range, extras, workers)
+    return written
+
+
+def main(argv=None):
+    """ Command line entry, the arguments come after -- on Blender's command line """
+    if argv is None:
+        argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]
+
+    parser = argparse.ArgumentParser(prog="ons.cli", description="Bakes onion skins into the disk cache of the open .blend file")
+    parser.add_argument("--objects", nargs="+", required=True, help="onion objects to bake")
+    parser.add_argument("--modes", nargs="+", default=["PF"], choices=modes, help="onion modes to bake")
+    parser.add_argument("--step", type=int, help="frame step of the PFS mode")
+    parser.add_argument("--frames", type=parse_range, help="only bake frames in start-end, the add-on bakes the rest when it loads the entry")
+    parser.add_argument("--extras", nargs="+", default=[], help="extra objects onion skinned together with every object")
+    parser.add_argument("--workers", type=int, default=0, help="bake with this many headless Blender processes")
+    args = parser.parse_args(argv)
+
+    written = bake(args.objects, args.modes, args.step, args.frames, args.extras, args.workers)
+    for (name, mode), count in written.items():
+        print("Baked {} frames of {} in {}".format(count, name, mode))
+
+
+if __name__ == "__main__":
+    main()
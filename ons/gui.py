@@ -42,9 +42,24 @@ class ANMX_gui(bpy.types.Panel):
             layout.separator(factor=0.2)
         
         
+        if bake_job:
+            row = layout.row(align=True)
+            row.label(text="Baking {} / {} frames".format(bake_job["done"], len(bake_job["frames"])), icon='TIME')
+            row.operator("anim_extras.cancel_bake", text="", icon='CANCEL')
+        
         col = layout.column()
         col.prop(access,"onion_object", text="Current", emboss=False, icon='OUTLINER_OB_MESH') #text="{}".format(access.onion_object), 
         
+        box = layout.box()
+        col = box.column(align=True)
+        row = col.row()
+        row.label(text="Extra Objects")
+        row.operator("anim_extras.add_onion_objects", text="", icon='ADD', emboss=False)
+        for i, item in enumerate(access.extra_objects):
+            row = col.row(align=True)
+            row.label(text=item.name, icon='OUTLINER_OB_MESH')
+            row.operator("anim_extras.remove_onion_object", text="", icon='X', emboss=False).index = i
+        
         col = layout.column()
         col.prop(access, "onion_mode", text="Method")
         
@@ -97,6 +112,67 @@ class ANMX_gui(bpy.types.Panel):
         col.prop(access, "use_xray")
         col.prop(access, "use_flat")
         col.prop(access, "in_front")
+        col.prop(access, "bake_window")
+        col.prop(access, "incremental_update")
+        col.prop(access, "auto_update")
+        if access.auto_update:
+            col.prop(access, "auto_update_delay")
+        col.prop(access, "background_bake")
+        if access.background_bake:
+            col.prop(access, "bake_chunk")
+        col.prop(access, "use_governor")
+        if access.use_governor:
+            col.prop(access, "draw_budget")
+            col.label(text="Playback Quality: " + quality_levels[governor["level"]], icon='INFO')
+        col.prop(access, "dedupe_frames")
+        if access.dedupe_frames:
+            col.prop(access, "dedupe_epsilon")
+        col.prop(access, "reduce_bake")
+        if access.reduce_bake:
+            col.prop(access, "bake_subdiv_cap")
+            col.prop(access, "bake_skip_modifiers", text="Skip")
+        col.prop(access, "fast_transform")
+        col.prop(access, "fast_armature")
+        col.prop(access, "use_disk_cache")
+        col.prop(access, "use_stash")
+        if access.use_stash:
+            col.prop(access, "stash_budget")
+        col.prop(access, "parallel_bake")
+        if access.parallel_bake:
+            col.prop(access, "bake_workers")
+        
+        col = layout.column(heading="Simplify", align=True)
+        col.prop(access, "ghost_style")
+        if access.ghost_style != "MESH":
+            col.prop(access, "point_count")
+            col.prop(access, "point_size")
+        col.prop(access, "use_lod")
+        if access.use_lod:
+            col.prop(access, "lod_budget")
+            col.prop(access, "lod_falloff")
+        
+        col = layout.column()
+        col.prop(access, "store_precision")
+        if access.store_precision != "FULL" and frame_data:
+            full, stored = stored_bytes()
+            col.label(text="Stored {:.1f} MB, saved {:.1f} MB".format(stored / 2**20, (full - stored) / 2**20), icon='INFO')
+        
+        box = layout.box()
+        row = box.row()
+        row.prop(access, "show_perf", icon='TRIA_DOWN' if access.show_perf else 'TRIA_RIGHT', emboss=False)
+        row.operator("anim_extras.dump_perf", text="", icon='EXPORT', emboss=False)
+        if access.show_perf:
+            report = perf.report(perf_extra())
+            col = box.column(align=True)
+            for name, entry in report["phases"].items():
+                col.label(text="{}: {:.1f} ms, {} calls".format(name, entry["seconds"] * 1000, entry["calls"]))
+            if not report["phases"]:
+                col.label(text="No bake timed yet")
+            
+            col = box.column(align=True)
+            col.label(text="Draw: {:.2f} ms average, {:.2f} ms max".format(report["draw"]["average"] * 1000, report["draw"]["max"] * 1000))
+            col.label(text="Frames: {:.1f} MB held".format(report["frame_data_bytes"] / 2**20))
+            col.label(text="Batches: {:.1f} MB on the GPU".format(report["batch_bytes"] / 2**20))
         
         layout.use_property_split = False
         layout.separator(factor=0.2)
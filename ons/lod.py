@@ -0,0 +1,95 @@
+###########################
+## Onion Skinning LOD
+###########################
+
+# Simplified ghost meshes made by vertex clustering. The clusters are computed once from the shared topology
+# and the first frame, every frame is then simplified by averaging the vertices of each cluster.
+# Kept free of bpy so it can be used outside of Blender.
+
+import numpy as np
+
+# Every level has this many times fewer triangles than the one before
+level_falloff = 4
+
+# Levels built below the full budget, the last one is used for every ghost further away
+level_count = 3
+
+# Cells along the longest side of the bounds, the search for the budget stays within these
+min_resolution = 2
+max_resolution = 1024
+
+
+class Lod:
+    """ A simplified mesh, every vertex of the full mesh belongs to one cluster """
+
+    def __init__(self, clusters, counts, indices):
+        self.clusters = clusters    # (N,) cluster of every full vertex
+        self.counts = counts        # (M,) vertices in every cluster
+        self.indices = indices      # (T, 3) triangles between clusters
+
+    def __len__(self):
+        return len(self.counts)
+
+
+def cluster(vertices, indices, resolution):
+    """ Merges the vertices in each cell of a grid with resolution cells along the longest side of the bounds """
+    low = vertices.min(axis=0)
+    size = max(float((vertices.max(axis=0) - low).max()), 1e-8) / resolution
+
+    cells = np.floor((vertices - low) / size).astype(np.int64)
+    span = resolution + 1
+    keys = cells[:, 0] + cells[:, 1] * span + cells[:, 2] * span * span
+
+    uniq, clusters = np.unique(keys, return_inverse=True)
+    clusters = clusters.astype('i')
+    counts = np.bincount(clusters, minlength=len(uniq)).astype('f')
+
+    # Triangles that collapsed into a line or point are dropped, ones merged onto the same clusters are kept once
+    tris = clusters[indices]
+    tris = tris[(tris[:, 0] != tris[:, 1]) & (tris[:, 1] != tris[:, 2]) & (tris[:, 0] != tris[:, 2])]
+    if len(tris):
+        _, first = np.unique(np.sort(tris, axis=1), axis=0, return_index=True)
+        tris = tris[np.sort(first)]
+
+    return Lod(clusters, counts, np.ascontiguousarray(tris, 'i'))
+
+
+def build(vertices, indices, budget):
+    """ Finds the finest clustering within the triangle budget, None when the mesh is within the budget already """
+    if len(indices) <= budget:
+        return None
+
+    # More cells keep more triangles, the largest resolution still within the budget is searched for
+    best = cluster(vertices, indices, min_resolution)
+    low = min_resolution + 1
+    high = max_resolution
+    while low <= high:
+        mid = (low + high) // 2
+        lod = cluster(vertices, indices, mid)
+        if len(lod.indices) <= budget:
+            best = lod
+            low = mid + 1
+        else:
+            high = mid - 1
+    return best
+
+
+def build_levels(vertices, indices, budget, count=level_count):
+    """ Builds the levels from the budget down, each one level_falloff times smaller. None is a level at full resolution """
+    levels = [build(vertices, indices, max(1, budget // level_falloff ** i)) for i in range(count)]
+    return levels if any(lod is not None for lod in levels) else []
+
+
+def apply(lod, vertices):
+    """ Simplifies the vertices of a frame with the full topology, every cluster is the average of its vertices """
+    out = np.empty((len(lod), 3), 'f')
+    for axis in range(3):
+        out[:, axis] = np.bincount(lod.clusters, weights=vertices[:, axis], minlength=len(lod)) / lod.counts
+    return out
+
+
+def level_of(distance, count, levels):
+    """ Level of a ghost distance frames away from the current one, the nearest ghosts get the finest level """
+    if levels <= 1 or count <= 0:
+        return 0
+    return min(levels - 1, (max(distance, 1) - 1) * levels // count)
@@ -2,30 +2,149 @@
 ## Onion Skinning Operators
 #############################
 
+import os
+import time
+import hashlib
+import shutil
+import tempfile
+import subprocess
+
 import bpy
 from bpy.app.handlers import persistent
 from bpy.types import Operator, PropertyGroup
 import gpu
 import bgl
-from gpu_extras.batch import batch_for_shader
 
 import numpy as np
-from mathutils import Vector, Matrix
+from bisect import bisect_left, bisect_right
+from mathutils import Vector, Matrix, Euler, Quaternion
+
+from . import store
+from . import workers
+from . import cache
+from . import skin
+from . import lod
+from . import perf
 
 # ########################################################## #
 # Data (stroring it in the object or scene doesnt work well) #
 # ########################################################## #
 
-shader = gpu.shader.from_builtin('3D_UNIFORM_COLOR')
+shaders = dict([])
+
+# Ghosts drawn with one upload of the colours and model matrices, more ghosts are drawn in groups of this size
+max_ghosts = 32
+
+# Ghosts of one window are merged into one batch up to this many vertices, heavier ghosts cost far more than their draw calls
+window_vertices = 500000
+
+# Every ghost's model matrix and colour are in uniform arrays, ghost picks the ones of the batch being drawn.
+# Instanced draws of one batch pick them by instance instead
+ghost_vertex = '''
+uniform mat4 ModelViewProjectionMatrix;
+uniform mat4 models[MAX_GHOSTS];
+uniform int ghost;
+
+in vec3 pos;
+flat out int index;
+
+void main()
+{
+    index = ghost + gl_InstanceID;
+    gl_Position = ModelViewProjectionMatrix * models[index] * vec4(pos, 1.0);
+}
+'''
+
+# Window batches hold several ghosts, slot tells every vertex the ghost it belongs to
+window_vertex = '''
+uniform mat4 ModelViewProjectionMatrix;
+uniform mat4 models[MAX_GHOSTS];
+uniform int ghost;
+
+in vec3 pos;
+in float slot;
+flat out int index;
+
+void main()
+{
+    index = ghost + int(slot);
+    gl_Position = ModelViewProjectionMatrix * models[index] * vec4(pos, 1.0);
+}
+'''
+
+ghost_fragment = '''
+uniform vec4 colors[MAX_GHOSTS];
+
+flat in int index;
+out vec4 fragColor;
+
+void main()
+{
+    fragColor = COLOR;
+}
+'''
+
+# Object channels the transform fast path can evaluate
+transform_paths = {"location", "rotation_euler", "rotation_quaternion", "rotation_axis_angle", "scale"}
+
+# Object channels making up its transform, deltas included
+transform_channels = ["location", "rotation_euler", "rotation_quaternion", "rotation_axis_angle", "scale", "delta_location", "delta_rotation_euler", "delta_rotation_quaternion", "delta_scale"]
+
+# Interface state of modifiers and constraints, changing these doesn't change the bake
+ui_properties = {"rna_type", "show_expanded", "is_active", "active", "show_in_editmode", "show_on_cage", "is_override_data", "is_override_data_editable", "persistent_uid"}
+
+# Modifiers that change the mesh over time on their own
+time_modifiers = {'WAVE', 'BUILD', 'OCEAN', 'NODES', 'EXPLODE', 'PARTICLE_SYSTEM', 'DYNAMIC_PAINT', 'CLOTH', 'SOFT_BODY', 'FLUID', 'COLLISION', 'SURFACE'}
 frame_data = dict([])
 batches = dict([])
+models = dict([])
+twins = dict([])
+poses = dict([])
+frame_poses = dict([])
+buffers = dict([])
+lod_batches = dict([])
 extern_data = dict([])
+bake_info = dict([])
+topology = dict([])
+bake_job = dict([])
+draw_data = dict([])
+key_index = dict([])
+stash = dict([])
+
+# Vertex group weights per mesh name, there is no bulk access to them so they are kept until the mesh is edited
+vertex_weights = dict([])
+
+# Folders holding the memory mapped results of parallel bakes, removed when the data is cleared
+worker_folders = []
+
+# Frames further than this many window radii from the current frame are dropped by the windowed bake
+window_margin = 3
+
+# Full precision frames are read into arrays of this many slots, a new one is only made once the slots before are taken
+pool_chunk = 16
+
+# Model matrix of ghosts that are baked in world space
+identity = np.identity(4, 'f')
+
+# Draw quality the governor falls back to during playback, level is the index into quality_levels
+quality_levels = ["Full", "Coarser", "Nearest Half", "Nearest Only", "Hidden"]
+governor = {"level": 0, "average": None, "draws": 0}
+
+# Weight of the latest draw time in the average and draws measured before the level can change again
+governor_smoothing = 0.3
+governor_settle = 5
+
+# Set while frames are being baked, the frame changes done by the bake should not trigger another one
+baking = False
+
+# Set while a render job runs, the windowed bake must not change frames under it
+rendering = False
 
 # ################ #
 # Functions        #
 # ################ #
 
-def frame_get_set(_obj, frame):
+def frame_get_set(_obj, frame, out=None):
     scn = bpy.context.scene
     anmx = scn.anmx_data
 
@@ -73,181 +192,1929 @@ def frame_get_set(_obj, frame):
 	# Gets all of the data from a mesh on a certain frame
     tmpobj = _obj
 
-    # Setting the frame to get an accurate reading of the object on the selected frame
-    scn = bpy.context.scene
-    scn.frame_set(frame)
+    # Setting the frame to get an accurate reading of the object on the selected frame
+    scn = bpy.context.scene
+    with perf.timed("frame_set"):
+        scn.frame_set(frame)
+
+    # Every onion object is read from the same evaluation of the frame
+    return read_objects([tmpobj] + extra_objects(), out)
+
+
+def extra_objects():
+    """ The other meshes that are onion skinned together with the onion object """
+    anmx = bpy.context.scene.anmx_data
+    
+    objs = []
+    for item in anmx.extra_objects:
+        if item.name != anmx.onion_object and item.name in bpy.data.objects:
+            obj = bpy.data.objects[item.name]
+            if obj.type == 'MESH':
+                objs.append(obj)
+    return objs
+
+
+def read_objects(objs, out=None):
+    """ Reads the objects as they are evaluated on the current frame and merges them into one mesh, written to out when it fits """
+    # The objects are stored as one mesh per frame on purpose. Every part of the add-on, stored frames, dedupe, pools, workers,
+    # the disk cache, stashes, LOD and drawing, handles them as one onion object. Entries per object would not make adding or
+    # removing an object cheaper, every frame still has to be set again for it and setting the frame is what a bake costs
+    if len(objs) == 1:
+        vertices, indices = read_frame(objs[0], out=out)
+        
+        # Skinned meshes come back in their own array, they are moved to out so the frame still uses its slot
+        if out is not None and vertices is not out and vertices.shape == out.shape:
+            out[:] = vertices
+            vertices = out
+        return [vertices, indices]
+    
+    parts = [read_frame(obj) for obj in objs]
+    
+    count = sum(len(part[0]) for part in parts)
+    if out is None or out.shape != (count, 3):
+        out = np.empty((count, 3), 'f')
+    vertices = np.concatenate([part[0] for part in parts], out=out)
+    
+    # Indices of every object are moved past the vertices of the objects before it
+    offsets = np.cumsum([0] + [len(part[0]) for part in parts[:-1]])
+    indices = np.concatenate([part[1] + offset for part, offset in zip(parts, offsets)]).astype('i')
+    
+    return [vertices, indices]
+
+
+def read_frame(_obj, local=False, out=None):
+    """ Reads the world space, or object space when local, vertices and triangles of the object as it is evaluated on the current frame, into out when it fits """
+    tmpobj = _obj
+    
+    # Meshes only deformed by an armature are skinned from the pose instead
+    data = get_skin(_obj)
+    if data is not None and not local:
+        return read_skinned(_obj, data)
+
+    with perf.timed("to_mesh"):
+        # Getting the Depenency Graph and the evaluated object
+        depsgraph = bpy.context.evaluated_depsgraph_get()
+        eval = tmpobj.evaluated_get(depsgraph)
+
+        # Making a new mesh from the object, it is owned by the evaluated object until to_mesh_clear
+        mesh = eval.to_mesh()
+    
+    try:
+        # loop triangles are needed to properly draw the mesh on screen, point and trail ghosts only need the vertices.
+        # Bake workers run without the add-on registered, they read the triangles and the add-on samples the frames
+        anmx = getattr(bpy.context.scene, "anmx_data", None)
+        sampled = anmx is not None and anmx.ghost_style != "MESH"
+        if not sampled:
+            with perf.timed("triangles"):
+                mesh.calc_loop_triangles()
+        
+        with perf.timed("foreach_get"):
+            # The object space vertices and the indices go to buffers reused by every frame
+            local_vertices = scratch("vertices", (len(mesh.vertices), 3), 'f')
+            indices = scratch("indices", (0 if sampled else len(mesh.loop_triangles), 3), 'i')
+            
+            # Getting all of the vertices and incices all at once (from: https://docs.blender.org/api/current/gpu.html#mesh-with-random-vertex-colors)
+            mesh.vertices.foreach_get(
+                "co", np.reshape(local_vertices, len(mesh.vertices) * 3))
+            if not sampled:
+                mesh.loop_triangles.foreach_get(
+                    "vertices", np.reshape(indices, len(mesh.loop_triangles) * 3))
+    finally:
+        eval.to_mesh_clear()
+    
+    if out is None or out.shape != local_vertices.shape:
+        out = np.empty(local_vertices.shape, 'f')
+    
+    # This moves the vertices by the object's world matrix, thus making everything global space, in one matrix multiplication
+    with perf.timed("transform"):
+        if local:
+            out[:] = local_vertices
+        else:
+            mat = np.array(_obj.matrix_world, 'f')
+            np.matmul(local_vertices, mat[:3, :3].T, out=out)
+            out += mat[:3, 3]
+    
+    return [out, keep_indices(indices)]
+
+
+def scratch(name, shape, dtype):
+    """ Returns a buffer of the shape that is reused by every frame, it is only reallocated when the size changes """
+    buf = buffers.get(name)
+    if buf is None or buf.shape != shape:
+        buf = np.empty(shape, dtype)
+        buffers[name] = buf
+    return buf
+
+
+def keep_indices(indices):
+    """ Returns indices that outlive the scratch buffer, the shared topology when they match it, otherwise a copy """
+    shared = topology.get("indices")
+    if shared is not None and shared.shape == indices.shape and np.array_equal(shared, indices):
+        return shared
+    return indices.copy()
+
+
+def skin_modifier(_obj):
+    """ Returns the armature modifier when it is the only modifier of the object and does plain linear blend skinning """
+    mods = [m for m in _obj.modifiers if m.show_viewport]
+    if len(mods) != 1 or mods[0].type != 'ARMATURE':
+        return None
+    
+    mod = mods[0]
+    if mod.object is None or not mod.use_vertex_groups or mod.use_bone_envelopes or mod.use_deform_preserve_volume:
+        return None
+    if mod.vertex_group or mod.use_multi_modifier:
+        return None
+    
+    # Shape keys and curved bendy bones deform in ways the fast path doesn't do
+    if _obj.data.shape_keys is not None:
+        return None
+    if any(b.use_deform and b.bbone_segments > 1 for b in mod.object.data.bones):
+        return None
+    
+    return mod
+
+
+def capture_skin(_obj, mod):
+    """ Reads the rest vertices, weights and triangles of the object once so frames can be skinned with NumPy """
+    mesh = _obj.data
+    bones = [b for b in mod.object.data.bones if b.use_deform]
+    names = [b.name for b in bones]
+    
+    rest = np.empty((len(mesh.vertices), 3), 'f')
+    mesh.vertices.foreach_get("co", np.reshape(rest, len(mesh.vertices) * 3))
+    
+    mesh.calc_loop_triangles()
+    indices = np.empty((len(mesh.loop_triangles), 3), 'i')
+    mesh.loop_triangles.foreach_get("vertices", np.reshape(indices, len(mesh.loop_triangles) * 3))
+    
+    # Vertex groups are matched to the deforming bones by name like the armature modifier does
+    group_bone = np.full(len(_obj.vertex_groups) + 1, -1, 'i')
+    for vg in _obj.vertex_groups:
+        if vg.name in names:
+            group_bone[vg.index] = names.index(vg.name)
+    
+    # Weights are read once per mesh and kept until it is edited, a full bake only reads the rest vertices and triangles again
+    vertex, group, weight = read_weights(mesh)
+    bone = group_bone[np.minimum(group, len(group_bone) - 1)]
+    used = (bone >= 0) & (weight > 0)
+    
+    rest_inv = np.array([np.array(b.matrix_local.inverted()) for b in bones], 'f').reshape(-1, 4, 4)
+    
+    return skin.skin_arrays(mod.name, names, rest, vertex[used], bone[used], weight[used], indices, rest_inv)
+
+
+def get_skin(_obj):
+    """ Captured skinning data of the object, None when the armature fast path can't be used for it """
+    anmx = getattr(bpy.context.scene, "anmx_data", None)
+    if anmx is None or not anmx.fast_armature or _obj.type != 'MESH':
+        return None
+    
+    skins = topology.setdefault("skins", dict([]))
+    if _obj.name not in skins:
+        mod = skin_modifier(_obj)
+        skins[_obj.name] = None if mod is None else capture_skin(_obj, mod)
+    return skins[_obj.name]
+
+
+def read_skinned(_obj, data):
+    """ Skins the captured rest vertices by the evaluated pose of the current frame """
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    eval = _obj.evaluated_get(depsgraph)
+    arm = _obj.modifiers[data.modifier].object.evaluated_get(depsgraph)
+    
+    pose = np.array([np.array(arm.pose.bones[name].matrix) for name in data.names], 'f').reshape(-1, 4, 4)
+    
+    # Same spaces as the armature modifier, object to armature space, deform, then armature to world space
+    arm_mat = np.array(arm.matrix_world)
+    premat = np.linalg.inv(arm_mat) @ np.array(eval.matrix_world)
+    with perf.timed("skin"):
+        vertices = skin.deform(data, pose, premat, arm_mat)
+    
+    return [vertices, data.indices]
+
+
+def mute_skinned(objs, mute):
+    """ Turns the armature modifiers of the skinned objects off while baking so the depsgraph doesn't deform them """
+    for _obj in objs:
+        data = get_skin(_obj)
+        if data is not None:
+            _obj.modifiers[data.modifier].show_viewport = not mute
+
+
+def reduce_modifiers(objs):
+    """ Caps subdivision levels and turns off the listed modifiers for the bake, returns what has to be restored """
+    anmx = bpy.context.scene.anmx_data
+    changed = []
+    if not anmx.reduce_bake:
+        return changed
+    
+    # Modifiers are listed by name or by type, separated by commas
+    skip = set(name.strip().lower() for name in anmx.bake_skip_modifiers.split(",") if name.strip())
+    
+    for _obj in objs:
+        for mod in _obj.modifiers:
+            if mod.show_viewport and (mod.name.lower() in skip or mod.type.lower() in skip):
+                changed.append((mod, "show_viewport", True))
+                mod.show_viewport = False
+            elif mod.type in {'SUBSURF', 'MULTIRES'} and mod.levels > anmx.bake_subdiv_cap:
+                changed.append((mod, "levels", mod.levels))
+                mod.levels = anmx.bake_subdiv_cap
+    
+    return changed
+
+
+def restore_modifiers(changed):
+    """ Puts back the modifier settings reduce_modifiers changed """
+    for mod, prop, value in reversed(changed):
+        setattr(mod, prop, value)
+
+
+def transform_only(_obj):
+    """ True when the onion object only moves by the keyed transforms of itself and its parent, its mesh never changes """
+    anmx = bpy.context.scene.anmx_data
+    if not anmx.fast_transform or _obj.type != 'MESH' or extra_objects():
+        return False
+    
+    mesh = _obj.data
+    if mesh.shape_keys is not None or (mesh.animation_data is not None and mesh.animation_data.action is not None):
+        return False
+    for mod in _obj.modifiers:
+        if mod.type in time_modifiers or getattr(mod, "object", None) is not None:
+            return False
+    
+    chain = [_obj]
+    if _obj.parent is not None:
+        # Only the parent of the keyobj logic is evaluated, bones or grand parents are not
+        if _obj.parent_type != 'OBJECT' or _obj.parent.parent is not None:
+            return False
+        chain.append(_obj.parent)
+    
+    for ob in chain:
+        if len(ob.constraints) or any(ob.delta_location) or any(ob.delta_rotation_euler) or tuple(ob.delta_scale) != (1, 1, 1):
+            return False
+        
+        ad = ob.animation_data
+        if ad is None:
+            continue
+        if len(ad.drivers) or len(ad.nla_tracks):
+            return False
+        if ad.action is not None and any(fc.data_path not in transform_paths for fc in ad.action.fcurves):
+            return False
+    
+    return True
+
+
+def basis_matrix(ob, frame):
+    """ Local matrix of the object on the frame, evaluated from its F-curves without setting the frame """
+    values = {
+        "location": list(ob.location),
+        "rotation_euler": list(ob.rotation_euler),
+        "rotation_quaternion": list(ob.rotation_quaternion),
+        "rotation_axis_angle": list(ob.rotation_axis_angle),
+        "scale": list(ob.scale),
+        }
+    
+    ad = ob.animation_data
+    if ad is not None and ad.action is not None:
+        for fc in ad.action.fcurves:
+            if not fc.mute:
+                values[fc.data_path][fc.array_index] = fc.evaluate(frame)
+    
+    if ob.rotation_mode == 'QUATERNION':
+        rot = Quaternion(values["rotation_quaternion"]).normalized().to_matrix().to_4x4()
+    elif ob.rotation_mode == 'AXIS_ANGLE':
+        angle = values["rotation_axis_angle"]
+        rot = Matrix.Rotation(angle[0], 4, Vector(angle[1:]))
+    else:
+        rot = Euler(values["rotation_euler"], ob.rotation_mode).to_matrix().to_4x4()
+    
+    return Matrix.Translation(values["location"]) @ rot @ Matrix.Diagonal(values["scale"]).to_4x4()
+
+
+def world_matrix(_obj, frame):
+    """ World matrix of the onion object on the frame, evaluated from the F-curves of itself and its parent """
+    mat = basis_matrix(_obj, frame)
+    if _obj.parent is not None:
+        mat = basis_matrix(_obj.parent, frame) @ _obj.matrix_parent_inverse @ mat
+    return np.array(mat, 'f')
+
+
+def bake_transforms(_obj, frames, target):
+    """ Bakes only a matrix per frame, the mesh is read once in object space and shared by every frame """
+    precision = bpy.context.scene.anmx_data.store_precision
+    
+    if "base" not in topology:
+        vertices, indices = sample_frame(*read_frame(_obj, local=True))
+        topology["base"] = [pack_vertices(vertices, precision), share_indices(indices)]
+    
+    vertices, indices = topology["base"]
+    with perf.timed("matrices"):
+        for f in frames:
+            target[str(f)] = [vertices, indices, world_matrix(_obj, f)]
+
+
+def get_shader(window=False):
+    """ Shader used to draw the onion skins, made on first use as there is no GPU when running in the background """
+    name = "window" if window else "ghost"
+    if name not in shaders:
+        # Matches the color space handling of the builtin uniform color shader
+        color = "colors[index]"
+        if bpy.app.version >= (2, 91, 0):
+            color = "blender_srgb_to_framebuffer_space(colors[index])"
+        
+        # The fragment stage picks the colour by the index passed on from the vertex stage, so instances get their own
+        vertex = (window_vertex if window else ghost_vertex).replace("MAX_GHOSTS", str(max_ghosts))
+        fragment = ghost_fragment.replace("MAX_GHOSTS", str(max_ghosts)).replace("COLOR", color)
+        shaders[name] = gpu.types.GPUShader(vertex, fragment)
+    return shaders[name]
+
+
+def release_worker_files():
+    """ Removes the files of parallel bakes, has to be called after the frames mapping them are cleared """
+    for folder in worker_folders:
+        shutil.rmtree(folder, ignore_errors=True)
+    worker_folders.clear()
+
+
+def set_to_active(_obj):
+    """ Sets the object that is being used for the onion skinning """
+    scn = bpy.context.scene
+    anmx = scn.anmx_data
+    
+    cancel_bake()
+    background = anmx.background_bake and _obj.type != 'EMPTY'
+    
+    # Switching to another object keeps the bake of the previous one around
+    if anmx.onion_object != _obj.name:
+        stash_active()
+    
+    # Clear all data > caused double drawing with mode switch
+    # Old clear method caused issues when using a rig
+    # Still see handler issue
+    # A background bake of the same object keeps the old frames until the new ones are done
+    if not (background and anmx.onion_object == _obj.name):
+        clear_data()
+
+    # skip clear if we are linked
+    if hasattr(anmx,"link_parent"):
+        if not anmx.link_parent == "":
+            clear_active(clrRig=False)
+
+    anmx.onion_object = _obj.name
+    anmx.is_linked = True if _obj.type == 'EMPTY' else False
+    
+    if anmx.is_linked:
+        if hasattr(anmx,"link_parent"):
+            if not anmx.link_parent:
+                anmx.link_parent = _obj.name
+
+    # A stashed bake only needs the keys edited since it was stashed
+    if _obj.type != 'EMPTY' and restore_stash(_obj):
+        if dirty_ranges(bake_info["keys"], key_snapshot(snapshot_objects(_obj))):
+            update_active()
+        return
+
+    if load_cache(_obj):
+        # Entries baked for part of the animation are completed here
+        missing = [f for f in wanted_frames(anmx, bake_info["frames"]) if str(f) not in frame_data]
+        if missing:
+            bake_list(_obj, missing)
+        make_batches()
+        return
+
+    if background:
+        keyframes = get_keyframes(_obj)
+        frames = mode_frames(anmx, keyframes)
+        start_bake(_obj, wanted_frames(anmx, frames), frames, keyframes, full=True)
+        return
+
+    bake_frames()
+    make_batches()
+    save_cache(_obj)
+
+
+def state_dicts():
+    """ Everything a bake of the onion object is made of, stashed and restored as a whole """
+    return {
+        "frame_data": frame_data, "batches": batches, "models": models, "twins": twins, "poses": poses, "frame_poses": frame_poses, "lod_batches": lod_batches,
+        "extern_data": extern_data, "bake_info": bake_info, "topology": topology,
+        }
+
+
+def stash_active():
+    """ Moves the bake of the onion object to the stash so switching back to the object doesn't bake it again """
+    anmx = bpy.context.scene.anmx_data
+    if not anmx.use_stash or bake_job or not frame_data or "settings" not in bake_info:
+        return
+    
+    # Linked rigs are made local for the bake and put back when cleared, they are baked again
+    if anmx.is_linked or getattr(anmx, "link_parent", ""):
+        return
+    
+    settings = bake_info["settings"]
+    stash.pop(settings, None)
+    stash[settings] = {
+        "state": dict((name, dict(d)) for name, d in state_dicts().items()),
+        "folders": list(worker_folders),
+        "bytes": list(held_bytes()),
+        }
+    
+    # The stashed frames may still map files of a parallel bake
+    worker_folders.clear()
+    fit_stash(anmx.stash_budget * 2**20)
+
+
+def restore_stash(_obj):
+    """ Puts back a stashed bake of the object made with the current settings, returns False when there is none """
+    anmx = bpy.context.scene.anmx_data
+    if not anmx.use_stash:
+        return False
+    
+    # Clearing the onion object clears its extra objects too, they come back with the object
+    if not anmx.extra_objects:
+        for settings in reversed(list(stash)):
+            if settings[0] == _obj.name:
+                for name in settings[1]:
+                    anmx.extra_objects.add().name = name
+                break
+    
+    entry = stash.pop(bake_settings(anmx), None)
+    if entry is None:
+        return False
+    
+    clear_data()
+    for name, d in state_dicts().items():
+        d.update(entry["state"][name])
+    worker_folders.extend(entry["folders"])
+    draw_data.clear()
+    
+    # Batches are dropped from stashed bakes that went over the budget
+    if not batches:
+        make_batches()
+    return True
+
+
+def fit_stash(budget):
+    """ Drops stashed bakes, least recently used first, until the stash fits the budget """
+    total = sum(sum(entry["bytes"]) for entry in stash.values())
+    
+    # GPU memory is released first, the batches of the least recently used bakes are built again when they are restored
+    for entry in stash.values():
+        if total <= budget:
+            return
+        if entry["bytes"][1]:
+            for name in ["batches", "models", "lod_batches"]:
+                entry["state"][name].clear()
+            for name in ["ibo", "lod_ibo", "base_batch"]:
+                entry["state"]["topology"].pop(name, None)
+            total -= entry["bytes"][1]
+            entry["bytes"][1] = 0
+    
+    for settings in list(stash):
+        if total <= budget:
+            return
+        entry = stash.pop(settings)
+        total -= sum(entry["bytes"])
+        for folder in entry["folders"]:
+            shutil.rmtree(folder, ignore_errors=True)
+
+
+def clear_stash():
+    """ Throws away every stashed bake """
+    fit_stash(-1)
+
+
+def clear_data():
+    """ Throws away all of the baked data """
+    frame_data.clear()
+    batches.clear()
+    models.clear()
+    twins.clear()
+    poses.clear()
+    frame_poses.clear()
+    lod_batches.clear()
+    draw_data.pop("frames", None)
+    draw_data.pop("windows", None)
+    extern_data.clear()
+    bake_info.clear()
+    topology.clear()
+    buffers.clear()
+    release_worker_files()
+    perf.reset()
+
+
+def clear_active(clrRig):
+    """ clrRig will do complete clear, sued with linked Rigs, allows to update it without deleting everuthing """
+    """ Clears the active object """ 
+
+    scn = bpy.context.scene
+    anmx = scn.anmx_data
+    name = anmx.onion_object
+    
+    cancel_bake()
+    cancel_auto()
+    stash_active()
+    
+    # Clears all the data needed to store onion skins on the previously selected object
+    clear_data()
+    key_index.clear()
+    
+    # Clear localzed rigs & overrides linked items
+    if clrRig:
+        anmx.extra_objects.clear()
+        if hasattr(anmx,"link_parent"):
+            if not anmx.link_parent == "":
+                bpy.data.collections["_animextras"].children[0].objects.unlink(bpy.data.objects[name])
+                bpy.data.collections.remove(bpy.data.collections[anmx.link_parent])
+                bpy.data.collections.remove(bpy.data.collections["_animextras"])
+                # Show original linked rig again
+                bpy.data.objects[anmx.link_parent].hide_viewport = False
+                anmx.link_parent = ""
+
+    # Gets rid of the selected object
+    anmx.onion_object = ""
+
+
+def vertex_sample(count):
+    """ Indices of the vertices point and trail ghosts keep, the same random sample for every frame with the vertex count """
+    samples = topology.setdefault("samples", dict([]))
+    if count not in samples:
+        size = bpy.context.scene.anmx_data.point_count
+        if size >= count:
+            samples[count] = np.arange(count, dtype='i')
+        else:
+            # A fixed seed keeps the sample the same between bakes, sorted so the vertices are read in order
+            samples[count] = np.sort(np.random.RandomState(0).choice(count, size, replace=False)).astype('i')
+    return samples[count]
+
+
+def sample_frame(vertices, indices):
+    """ Keeps only the sampled vertices of a frame for point and trail ghosts, their indices take the place of the triangles """
+    # Frames from the disk cache were sampled when they were baked
+    if bpy.context.scene.anmx_data.ghost_style == "MESH" or indices.ndim == 1:
+        return vertices, indices
+    
+    sample = vertex_sample(len(vertices))
+    return vertices[sample], sample
+
+
+def share_indices(indices):
+    """ Returns the shared index array when the frame has the same topology, otherwise the frame keeps its own """
+    shared = topology.get("indices")
+    
+    # The first baked frame decides the shared topology
+    if shared is None:
+        topology["indices"] = indices
+        return indices
+    
+    if indices is shared:
+        return shared
+    if shared.shape == indices.shape and np.array_equal(shared, indices):
+        return shared
+    return indices
+
+
+def pack_vertices(vertices, precision):
+    """ Packs the vertices for storage, the first baked frame is kept as the reference the others are packed against """
+    reference = topology.get("reference")
+    
+    if reference is None:
+        topology["reference"] = vertices
+        return vertices
+    
+    return store.pack(vertices, reference, precision)
+
+
+def frame_vertices(arg):
+    """ Returns the float32 vertices of a baked frame, packed frames are decoded here """
+    return store.unpack(arg[0], topology.get("reference"))
+
+
+def stored_bytes():
+    """ Returns the bytes the baked vertices would take unpacked and the bytes they actually take """
+    full = 0
+    stored = 0
+    
+    # Frames can share their vertices, those are only counted once
+    counted = set()
+    for arg in frame_data.values():
+        if id(arg[0]) in counted:
+            continue
+        counted.add(id(arg[0]))
+        full += store.full_nbytes(arg[0])
+        stored += store.nbytes(arg[0])
+    return full, stored
+
+
+def held_bytes():
+    """ Estimates the bytes held by the baked frames and by their batches on the GPU, shared arrays are counted once """
+    stored = stored_bytes()[1]
+    uploaded = 0
+    
+    vertices = set()
+    indices = set()
+    for key, arg in frame_data.items():
+        if id(arg[1]) not in indices:
+            indices.add(id(arg[1]))
+            stored += arg[1].nbytes
+            uploaded += arg[1].nbytes
+        
+        # The frames of the transform fast path and frames with the same pose share one vertex buffer
+        if key in batches and id(arg[0]) not in vertices:
+            vertices.add(id(arg[0]))
+            uploaded += store.full_nbytes(arg[0])
+    
+    levels = lod_levels()
+    for simple in levels:
+        if simple is not None:
+            uploaded += simple.indices.nbytes
+    for name, level in lod_batches:
+        simple = levels[min(level, len(levels) - 1)]
+        if simple is not None:
+            uploaded += len(simple) * 3 * 4
+    
+    return stored, uploaded
+
+
+def perf_extra():
+    """ Memory entries added to the performance report """
+    stored, uploaded = held_bytes()
+    return {"frames": len(frame_data), "frame_data_bytes": stored, "batch_bytes": uploaded}
+
+
+def vertex_format():
+    """ Vertex format of the onion batches, only positions are needed by the shader """
+    if "format" not in topology:
+        fmt = gpu.types.GPUVertFormat()
+        fmt.attr_add(id="pos", comp_type='F32', len=3, fetch_mode='FLOAT')
+        topology["format"] = fmt
+    return topology["format"]
+
+
+def window_format():
+    """ Vertex format of the window batches, the positions and the slot of the ghost every vertex belongs to """
+    if "window_format" not in topology:
+        fmt = gpu.types.GPUVertFormat()
+        fmt.attr_add(id="pos", comp_type='F32', len=3, fetch_mode='FLOAT')
+        fmt.attr_add(id="slot", comp_type='F32', len=1, fetch_mode='FLOAT')
+        topology["window_format"] = fmt
+    return topology["window_format"]
+
+
+def index_buffer(indices):
+    """ Returns the GPU index buffer for the indices, the shared topology is only uploaded once """
+    if indices is not topology.get("indices"):
+        return gpu.types.GPUIndexBuf(type='TRIS', seq=indices)
+    
+    if "ibo" not in topology:
+        topology["ibo"] = gpu.types.GPUIndexBuf(type='TRIS', seq=indices)
+    return topology["ibo"]
+
+
+def make_batches(keys=None, source=None):
+    """ Builds the batches for the given frame keys, or for every baked frame when none are given """
+    # Custom OSL shader could be set here
+    if source is None:
+        source = frame_data
+    if keys is None:
+        keys = list(source)
+    
+    # Trails run to the next baked frame, so the frame before a re-baked one is built again too
+    trails = trail_order(source)
+    if trails is not None:
+        keys = trail_keys(keys, trails)
+    
+    # Frames sharing the pose of an earlier frame come last so the batch they share is built first
+    keys = sorted(keys, key=lambda k: k in twins)
+    
+    for key in keys:
+        arg = source.get(key) or frame_data[key]  # Dictionaries are used rather than lists or arrays so that frame numbers are a given
+        
+        # Every trail has its own batch, frames with the same pose still go to different frames
+        if trails is not None:
+            vertices, kind = trail_vertices(arg, trail_next(key, trails, source))
+            vbo = vertex_buffer(vertices)
+            with perf.timed("batch"):
+                batch = gpu.types.GPUBatch(type=kind, buf=vbo)
+            set_batch(key, batch)
+            continue
+        
+        # Frames of the transform fast path share one batch of the mesh and only differ by their matrix
+        if len(arg) > 2:
+            set_batch(key, base_batch(arg), arg[2])
+            continue
+        
+        # Frames with the pose of an earlier frame share its batch
+        twin = twins.get(key)
+        if twin is not None and twin in batches and (source.get(twin) or frame_data.get(twin)) is arg:
+            set_batch(key, batches[twin])
+            continue
+        
+        vertices, simple = batch_vertices(arg)
+        set_batch(key, new_batch(vertex_buffer(vertices), arg, simple))
+
+
+def trail_order(source):
+    """ Maps every baked frame to the one after it when sampled ghosts are drawn as trails, None otherwise """
+    indices = topology.get("indices")
+    if bpy.context.scene.anmx_data.ghost_style != "TRAILS" or indices is None or indices.ndim != 1:
+        return None
+    order = sorted(set(frame_data) | set(source), key=int)
+    return dict(zip(order, order[1:]))
+
+
+def trail_keys(keys, links):
+    """ Adds the frame before every key that has a batch already, its trail runs to the key """
+    before = dict((after, key) for key, after in links.items())
+    keys = set(keys)
+    for key in list(keys):
+        if before.get(key) in batches:
+            keys.add(before[key])
+    return list(keys)
+
+
+def trail_next(key, links, source):
+    """ The baked frame after the key, None for the last one """
+    after = links.get(key)
+    if after is None:
+        return None
+    return source.get(after) or frame_data.get(after)
+
+
+def world_vertices(arg):
+    """ Vertices of a baked frame in world space, frames of the transform fast path are moved by their matrix """
+    vertices = frame_vertices(arg)
+    if len(arg) > 2:
+        vertices = vertices @ arg[2][:3, :3].T + arg[2][:3, 3]
+    return vertices
+
+
+def trail_vertices(arg, after):
+    """ Line segments from every sampled vertex to where it is on the next frame, just the points when there is no next frame with the same sample """
+    vertices = world_vertices(arg)
+    if after is None or after[1] is not arg[1]:
+        return vertices, 'POINTS'
+    
+    lines = np.empty((len(vertices) * 2, 3), 'f')
+    lines[0::2] = vertices
+    lines[1::2] = world_vertices(after)
+    return lines, 'LINES'
+
+
+def new_batch(vbo, arg, simple):
+    """ Batch of a frame, sampled frames are drawn as points """
+    with perf.timed("batch"):
+        if arg[1].ndim == 1:
+            return gpu.types.GPUBatch(type='POINTS', buf=vbo)
+        return gpu.types.GPUBatch(type='TRIS', buf=vbo, elem=batch_indices(arg, simple))
+
+
+def batch_vertices(arg, level=0):
+    """ Returns the vertices a frame's batch uploads and the level they were simplified with, None when they are not """
+    vertices = frame_vertices(arg)
+    
+    # Frames with the shared topology are simplified when it is over the triangle budget
+    levels = lod_levels() if arg[1] is topology.get("indices") else []
+    simple = levels[min(level, len(levels) - 1)] if levels else None
+    if simple is not None:
+        with perf.timed("lod"):
+            vertices = lod.apply(simple, vertices)
+    return vertices, simple
+
+
+def batch_indices(arg, simple):
+    """ Index buffer of a frame's batch, frames with the shared topology or a simplified level reuse its buffer """
+    if simple is not None:
+        return lod_buffer(simple)
+    return index_buffer(arg[1])
+
+
+def vertex_buffer(vertices):
+    """ Uploads the positions to a new GPU vertex buffer """
+    # Buffers are never refilled in place, GPUVertBuf.attr_fill raises ValueError once a buffer was uploaded,
+    # so a re-baked frame always gets a new buffer
+    with perf.timed("vertex_buffer"):
+        vbo = gpu.types.GPUVertBuf(vertex_format(), len(vertices))
+        vbo.attr_fill("pos", vertices)
+    return vbo
+
+
+def make_batch(arg, level=0):
+    """ Builds the batch of a frame, only the vertices are uploaded, frames with the shared topology reuse its index buffer """
+    vertices, simple = batch_vertices(arg, level)
+    return new_batch(vertex_buffer(vertices), arg, simple)
+
+
+def base_batch(arg):
+    """ The one batch shared by the frames of the transform fast path """
+    if "base_batch" not in topology:
+        topology["base_batch"] = make_batch(arg)
+    return topology["base_batch"]
+
+
+def lod_levels():
+    """ Returns the simplified levels of the shared topology, built once from the first frame. Empty when not in use """
+    anmx = bpy.context.scene.anmx_data
+    if not anmx.use_lod or "indices" not in topology or "reference" not in topology:
+        return []
+    
+    # Point and trail ghosts have no triangles to simplify
+    if topology["indices"].ndim != 2:
+        return []
+    
+    if "lod" not in topology:
+        count = lod.level_count if anmx.lod_falloff else 1
+        topology["lod"] = lod.build_levels(topology["reference"], topology["indices"], anmx.lod_budget, count)
+    return topology["lod"]
+
+
+def lod_buffer(simple):
+    """ Returns the GPU index buffer of a level, every level is uploaded once """
+    buffers = topology.setdefault("lod_ibo", dict([]))
+    if id(simple) not in buffers:
+        buffers[id(simple)] = gpu.types.GPUIndexBuf(type='TRIS', seq=simple.indices)
+    return buffers[id(simple)]
+
+
+def ghost_batch(key, level):
+    """ Returns the batch of a frame at a level, the coarser levels are only built once they are drawn """
+    if level == 0 or len(lod_levels()) <= 1:
+        return batches[key]
+    
+    # Frames of the transform fast path share the mesh so they share its levels too, so do frames with the same pose
+    name = key
+    if key in models:
+        name = "base"
+    elif key in twins and frame_data.get(twins[key]) is frame_data.get(key):
+        name = twins[key]
+    if (name, level) not in lod_batches:
+        arg = bake_job.get("staged", {}).get(key) or frame_data.get(key)
+        if arg is None:
+            return batches[key]
+        lod_batches[(name, level)] = make_batch(arg, level)
+    return lod_batches[(name, level)]
+
+
+def drop_lod_batches(key):
+    """ Removes the coarser levels of a frame, they are built again when drawn """
+    for level in range(1, lod.level_count):
+        lod_batches.pop((key, level), None)
+
+
+def reset_lod():
+    """ Rebuilds the batches after the LOD settings changed, the baked frames stay as they are """
+    for name in ["lod", "lod_ibo", "base_batch"]:
+        topology.pop(name, None)
+    lod_batches.clear()
+    
+    if frame_data:
+        make_batches()
+
+
+def set_batch(key, batch, model=None):
+    """ Stores the batch of a frame and its model matrix if it has one, new frames make the sorted frame index rebuild """
+    if key not in batches:
+        draw_data.pop("frames", None)
+    batches[key] = batch
+    drop_lod_batches(key)
+    
+    if model is None:
+        models.pop(key, None)
+    else:
+        models[key] = model
+
+
+def drop_batch(key):
+    """ Removes the batch of a frame if there is one """
+    models.pop(key, None)
+    forget_pose(key)
+    drop_lod_batches(key)
+    if batches.pop(key, None) is not None:
+        draw_data.pop("frames", None)
+
+
+def window_batches(group, windows):
+    """ Splits a group of ghosts into window batches of the ones with the shared topology at the same level and the ghosts drawn one by one.
+    Groups are only merged when they are drawn a second time, during playback every redraw has other ghosts and nothing is uploaded """
+    previous = draw_data.get("windows", dict([]))
+    merged = []
+    single = [(ghost[0], i) for i, ghost in enumerate(group)]
+    
+    levels = dict([])
+    count = 0
+    for i, (batch, color, model, key, level) in enumerate(group):
+        arg = bake_job.get("staged", {}).get(key) or frame_data.get(key)
+        if arg is not None and key not in models and arg[1] is topology.get("indices") and arg[1].ndim == 2:
+            levels.setdefault(level, []).append(i)
+            count = len(arg[0])
+    
+    for level, members in levels.items():
+        if len(members) < 2 or len(members) * count > window_vertices:
+            continue
+        
+        # The batches of the ghosts are part of the signature, a re-baked frame has a new batch
+        signature = tuple((group[i][0], i) for i in members)
+        if signature not in previous:
+            windows[signature] = None
+            continue
+        
+        batch = previous[signature] or window_batch(group, members, level)
+        windows[signature] = batch
+        merged.append((batch, 0))
+        single = [draw for draw in single if draw[1] not in members]
+    
+    return merged, single
+
+
+def window_batch(group, members, level):
+    """ One batch of the ghosts of the group at the indices in members, the slot of every vertex is its ghost's index in the group """
+    with perf.timed("window_batch"):
+        parts = []
+        for i in members:
+            key = group[i][3]
+            vertices, simple = batch_vertices(bake_job.get("staged", {}).get(key) or frame_data[key], level)
+            parts.append(vertices)
+        
+        count = len(parts[0])
+        indices = topology["indices"] if simple is None else simple.indices
+        offsets = np.arange(len(parts), dtype='i') * count
+        
+        vbo = gpu.types.GPUVertBuf(window_format(), count * len(parts))
+        vbo.attr_fill("pos", np.concatenate(parts))
+        vbo.attr_fill("slot", np.repeat(np.array(members, 'f'), count))
+        ibo = gpu.types.GPUIndexBuf(type='TRIS', seq=(indices[None] + offsets[:, None, None]).reshape(-1, 3))
+        return gpu.types.GPUBatch(type='TRIS', buf=vbo, elem=ibo)
+
+
+def batch_frames():
+    """ Sorted frames that have a batch, only rebuilt after batches were added or dropped """
+    if "frames" not in draw_data:
+        draw_data["frames"] = sorted(int(key) for key in batches)
+    return draw_data["frames"]
+
+
+def visible_frames(curr, count):
+    """ Frames with a batch within count of the current frame """
+    frames = batch_frames()
+    return frames[bisect_left(frames, curr - count):bisect_right(frames, curr + count)]
+
+
+def color_table(anmx):
+    """ Colours of the ghosts by their offset to the current frame, from -skin_count to skin_count """
+    count = anmx.skin_count
+    pc = anmx.past_color
+    fc = anmx.future_color
+    
+    # plain is used by every mode but Inbetweening, None means the ghost is not drawn
+    table = {"plain": [], "inbetween": [], "key": []}
+    for offset in range(-count, count + 1):
+        f_dif = abs(offset)
+        past = (pc[0], pc[1], pc[2], anmx.past_opacity_start-((anmx.past_opacity_start-anmx.past_opacity_end)/count) * f_dif)
+        future = (fc[0], fc[1], fc[2], anmx.future_opacity_start-((anmx.future_opacity_start-anmx.future_opacity_end)/count) * f_dif)
+        
+        if offset == 0:
+            past = future = None
+        
+        if offset < 0:
+            table["plain"].append(past if anmx.past_enabled else None)
+        else:
+            table["plain"].append(future if anmx.future_enabled else None)
+        table["inbetween"].append(past)
+        table["key"].append(future)
+    
+    return table
+
+
+def get_colors(anmx):
+    """ Returns the colour table, it is rebuilt only after a colour or opacity setting changed """
+    if "colors" not in draw_data:
+        draw_data["colors"] = color_table(anmx)
+    return draw_data["colors"]
+
+
+def get_keyobj(_obj):
+    """ Returns the object holding the animation of the onion object """
+    keyobj = _obj
+    
+    if _obj.parent is not None:
+        keyobj = _obj.parent
+    # Check if obj is linked rig
+    elif hasattr(_obj.instance_collection, "all_objects"):
+        keyobj = _obj.instance_collection.all_objects[_obj.name]
+    
+    return keyobj
+
+
+def get_keyobjs(_obj):
+    """ Returns the objects holding the animation of the onion object and of the extra onion objects """
+    keyobjs = [get_keyobj(_obj)]
+    
+    for obj in extra_objects():
+        keyobj = get_keyobj(obj)
+        if keyobj in keyobjs or keyobj.animation_data is None or keyobj.animation_data.action is None:
+            continue
+        keyobjs.append(keyobj)
+    
+    return keyobjs
+
+
+def action_stamp(action):
+    """ Changes when the action is replaced or curves or keys are added or removed, moved keys are caught by the depsgraph handler """
+    return (action.as_pointer(), len(action.fcurves), sum(len(fc.keyframe_points) for fc in action.fcurves))
+
+
+def read_action(action):
+    """ Reads the keys of every F-curve of the action in bulk, returns the sorted unique key frames and the keys per curve """
+    curves = dict([])
+    frames = []
+    
+    for fc in action.fcurves:
+        points = fc.keyframe_points
+        count = len(points)
+        
+        # Columns are frame, value, left handle, right handle and interpolation
+        keys = np.empty((count, 7), 'f')
+        for i, prop in enumerate(["co", "handle_left", "handle_right"]):
+            data = np.empty(count * 2, 'f')
+            points.foreach_get(prop, data)
+            keys[:, i * 2:i * 2 + 2] = np.reshape(data, (count, 2))
+        
+        interpolation = np.empty(count, 'i')
+        points.foreach_get("interpolation", interpolation)
+        keys[:, 6] = interpolation
+        
+        # Curves with modifiers (cycles, noise...) can change frames anywhere so they are flagged
+        curves[(fc.data_path, fc.array_index)] = (keys, len(fc.modifiers) > 0)
+        frames.append(keys[:, 0])
+    
+    # Frames are truncated like int() does
+    frames = np.unique(np.concatenate(frames).astype(int)) if frames else np.empty(0, int)
+    return frames, curves
+
+
+def get_action_keys(action):
+    """ Returns the cached key frames and keys per curve of the action, read again only after it changed """
+    entry = key_index.get(action.name)
+    stamp = action_stamp(action)
+    
+    if entry is None or entry["stamp"] != stamp:
+        frames, curves = read_action(action)
+        entry = {"stamp": stamp, "frames": frames, "curves": curves}
+        key_index[action.name] = entry
+    
+    return entry
+
+
+def get_keyframes(_obj):
+    """ Returns the sorted frames of all the keyframes that animate the onion objects """
+    keyframes = [get_action_keys(keyobj.animation_data.action)["frames"] for keyobj in get_keyobjs(_obj)]
+    return np.unique(np.concatenate(keyframes))
+
+
+def mode_frames(anmx, keyframes):
+    """ Returns every frame the current onion mode needs baked """
+    start = int(np.min(keyframes))
+    end = int(np.max(keyframes)) + 1
+    
+    if anmx.onion_mode == "PFS":
+        return list(range(start, end, anmx.skin_step))
+    if anmx.onion_mode == "DC":
+        return [int(k) for k in keyframes]
+    
+    # PF and INB bake every frame
+    return list(range(start, end))
+
+
+def window_radius(anmx):
+    """ Distance from the current frame in which onion skins can be shown """
+    if anmx.onion_mode == "PFS":
+        return anmx.skin_count * anmx.skin_step
+    return anmx.skin_count
+
+
+def window_frames(frames, curr, radius):
+    """ Filters frames down to the ones inside the window around the current frame """
+    return [f for f in frames if abs(f - curr) <= radius]
+
+
+def wanted_frames(anmx, frames):
+    """ Returns the frames that should be baked right away, all of them unless the bake is windowed """
+    if anmx.bake_window:
+        return window_frames(frames, bpy.context.scene.frame_current, window_radius(anmx))
+    return frames
+
+
+def key_snapshot(keyobjs):
+    """ Collects the key positions, handles and interpolation of every F-curve so later updates can tell what changed """
+    snapshot = dict([])
+    
+    for keyobj in keyobjs:
+        curves = get_action_keys(keyobj.animation_data.action)["curves"]
+        for (path, index), keys in curves.items():
+            snapshot[(keyobj.name, path, index)] = keys
+    
+    return snapshot
+
+
+def curve_dirty_range(old, new):
+    """ Returns the frame range of a single F-curve that is affected by the keys that differ between old and new """
+    old_rows = set(map(tuple, old.tolist()))
+    new_rows = set(map(tuple, new.tolist()))
+    changed = [row[0] for row in old_rows ^ new_rows]
+    
+    # Arrays that only differ by duplicate keys on one frame don't tell where the curve changed
+    if not changed:
+        return (-np.inf, np.inf)
+    
+    lo = min(changed)
+    hi = max(changed)
+    
+    # A key shapes the curve up to its neighbouring keys, before the first and after the last key it extrapolates
+    frames = np.union1d(old[:, 0], new[:, 0])
+    before = frames[frames < lo]
+    after = frames[frames > hi]
+    
+    start = int(np.floor(before[-1])) if len(before) else -np.inf
+    end = int(np.ceil(after[0])) if len(after) else np.inf
+    
+    return (start, end)
+
+
+def dirty_ranges(old, new):
+    """ Returns the frame ranges whose evaluation may have changed between two key snapshots """
+    ranges = []
+    
+    for path in set(old) | set(new):
+        # Added or removed curves affect everything
+        if path not in old or path not in new:
+            return [(-np.inf, np.inf)]
+        
+        old_keys, old_mods = old[path]
+        new_keys, new_mods = new[path]
+        if old_keys.shape == new_keys.shape and np.array_equal(old_keys, new_keys):
+            continue
+        
+        if old_mods or new_mods or len(old_keys) == 0 or len(new_keys) == 0:
+            return [(-np.inf, np.inf)]
+        
+        ranges.append(curve_dirty_range(old_keys, new_keys))
+    
+    return ranges
+
+
+def rna_values(struct):
+    """ Values of the settings of a modifier, constraint or similar, datablocks they point to by name """
+    values = []
+    for prop in struct.bl_rna.properties:
+        if prop.identifier in ui_properties or prop.type == 'COLLECTION':
+            continue
+        
+        value = getattr(struct, prop.identifier, None)
+        if prop.type == 'POINTER':
+            value = value.name if isinstance(value, bpy.types.ID) else None
+        elif isinstance(value, set):
+            value = tuple(sorted(value))
+        elif hasattr(value, "__len__") and not isinstance(value, str):
+            # Arrays, vectors and matrices
+            value = np.array(value, 'f').tolist()
+        values.append((prop.identifier, value))
+    return values
+
+
+def curve_values(fc):
+    """ Settings of an F-curve that are not its keys, drivers also have their keys and variables read """
+    values = [fc.data_path, fc.array_index, fc.extrapolation, fc.mute]
+    values += [rna_values(mod) for mod in fc.modifiers]
+    
+    driver = fc.driver
+    if driver is not None:
+        values += [driver.type, driver.expression, [tuple(point.co) for point in fc.keyframe_points]]
+        for var in driver.variables:
+            values += [var.name, var.type]
+            values += [(t.id.name if t.id else None, t.data_path, t.bone_target, t.transform_type, t.transform_space) for t in var.targets]
+    return values
+
+
+def constraint_values(con):
+    """ Settings of a constraint, constraints with several targets like Armature have each of them read """
+    return [rna_values(con)] + [rna_values(target) for target in getattr(con, "targets", [])]
+
+
+def object_targets(obj):
+    """ Objects the modifiers, constraints and drivers of the object point to, and its parent """
+    structs = list(obj.modifiers) + list(obj.constraints)
+    if obj.pose is not None:
+        for bone in obj.pose.bones:
+            structs += list(bone.constraints)
+    
+    targets = [obj.parent]
+    for struct in structs:
+        for prop in struct.bl_rna.properties:
+            if prop.type == 'POINTER' and prop.identifier not in ui_properties:
+                targets.append(getattr(struct, prop.identifier, None))
+        targets += [getattr(target, "target", None) for target in getattr(struct, "targets", [])]
+    
+    anim = obj.animation_data
+    if anim is not None:
+        for fc in anim.drivers:
+            for var in fc.driver.variables:
+                targets += [t.id for t in var.targets]
+    
+    return [t for t in targets if isinstance(t, bpy.types.Object)]
+
+
+def dependency_objects(_obj):
+    """ Objects the bake reads besides the onion objects and the ones holding their keys, like lattices, hooks and constraint targets """
+    known = [_obj] + extra_objects() + get_keyobjs(_obj)
+    found = []
+    queue = list(known)
+    
+    # Targets can have targets of their own, like a hook empty parented to a bone
+    while queue:
+        for target in object_targets(queue.pop()):
+            if target not in known and target not in found:
+                found.append(target)
+                queue.append(target)
+    
+    return sorted(found, key=lambda o: o.name)
+
+
+def snapshot_objects(_obj):
+    """ Objects whose keys are part of the key snapshot, the ones holding the animation and the animated dependencies """
+    keyobjs = get_keyobjs(_obj)
+    for obj in dependency_objects(_obj):
+        if obj.animation_data is not None and obj.animation_data.action is not None:
+            keyobjs.append(obj)
+    return keyobjs
+
+
+def static_transform(obj):
+    """ Parenting and the transform channels of the object that are not animated, the animated ones are in the key snapshot """
+    keyed = set()
+    anim = obj.animation_data
+    if anim is not None:
+        curves = list(anim.drivers) + (list(anim.action.fcurves) if anim.action is not None else [])
+        keyed = set((fc.data_path, fc.array_index) for fc in curves)
+    
+    values = [obj.parent.name if obj.parent else None, obj.parent_type, obj.parent_bone, obj.rotation_mode, np.array(obj.matrix_parent_inverse, 'f').tolist()]
+    for path in transform_channels:
+        values += [value for i, value in enumerate(getattr(obj, path)) if (path, i) not in keyed]
+    return values
+
+
+def read_weights(mesh):
+    """ Vertex group weights of the mesh as flat arrays of the vertex, group and weight of every assignment, ordered by vertex """
+    # Meshes of another file or replaced meshes can have the same name
+    stamp = (mesh.as_pointer(), len(mesh.vertices))
+    if vertex_weights.get(mesh.name, [None])[0] != stamp:
+        counts = []
+        pairs = []
+        for v in mesh.vertices:
+            groups = v.groups
+            counts.append(len(groups))
+            pairs += [(g.group, g.weight) for g in groups]
+        
+        pairs = np.array(pairs, 'f').reshape(-1, 2)
+        vertex = np.repeat(np.arange(len(counts), dtype='i'), counts)
+        vertex_weights[mesh.name] = (stamp, (vertex, pairs[:, 0].astype('i'), np.ascontiguousarray(pairs[:, 1])))
+    return vertex_weights[mesh.name][1]
+
+
+def data_values(obj):
+    """ Coordinates of the mesh, lattice or curve of the object, with the weights and shape keys of meshes """
+    data = obj.data
+    values = []
+    if obj.type == 'MESH':
+        co = np.empty(len(data.vertices) * 3, 'f')
+        data.vertices.foreach_get("co", co)
+        values += [co, [vg.name for vg in obj.vertex_groups]]
+        values += list(read_weights(data))
+        if data.shape_keys is not None:
+            for block in data.shape_keys.key_blocks:
+                co = np.empty(len(block.data) * 3, 'f')
+                block.data.foreach_get("co", co)
+                values += [rna_values(block), co]
+    
+    elif obj.type == 'LATTICE':
+        co = np.empty(len(data.points) * 3, 'f')
+        data.points.foreach_get("co_deform", co)
+        values += [rna_values(data), co]
+    
+    elif obj.type == 'CURVE':
+        values.append(rna_values(data))
+        for spline in data.splines:
+            values.append(rna_values(spline))
+            for points, props in [(spline.bezier_points, ["co", "handle_left", "handle_right"]), (spline.points, ["co"])]:
+                for prop in props:
+                    # Points of poly and NURBS splines have a weight as fourth coordinate
+                    co = np.empty(len(points) * (4 if points is spline.points else 3), 'f')
+                    points.foreach_get(prop, co)
+                    values.append(co)
+    
+    return values
+
+
+def input_digest(_obj):
+    """ Hashes what the bake depends on besides the keys: the meshes, weights and shape keys, armature rest poses, transforms that are not animated,
+    modifier and constraint settings and their targets, drivers and F-curve extrapolation and modifiers """
+    parts = []
+    objs = [_obj] + extra_objects()
+    deps = dependency_objects(_obj)
+    
+    # Rest poses of the armatures deforming the meshes or holding their keys
+    rigs = [o for o in get_keyobjs(_obj) + deps if o.type == 'ARMATURE']
+    for obj in objs:
+        rigs += [mod.object for mod in obj.modifiers if mod.type == 'ARMATURE' and mod.object is not None]
+    for rig in sorted(set(rigs), key=lambda o: o.name):
+        rest = np.empty(len(rig.data.bones) * 16, 'f')
+        rig.data.bones.foreach_get("matrix_local", rest)
+        parts += [rig.name, rest]
+    
+    # Targets of modifiers, constraints and drivers are read like the onion objects, their keys are in the key snapshot
+    for obj in objs + [o for o in get_keyobjs(_obj) if o not in objs] + deps:
+        parts += [obj.name, static_transform(obj)]
+        parts += data_values(obj)
+        
+        parts += [rna_values(mod) for mod in obj.modifiers]
+        for con in obj.constraints:
+            parts += constraint_values(con)
+        if obj.pose is not None:
+            for bone in obj.pose.bones:
+                for con in bone.constraints:
+                    parts += constraint_values(con)
+        
+        anim = obj.animation_data
+        if anim is not None:
+            curves = list(anim.drivers) + (list(anim.action.fcurves) if anim.action is not None else [])
+            parts += [curve_values(fc) for fc in curves]
+    
+    return cache.make_key(parts)
+
+
+def bake_settings(anmx):
+    """ Settings that require a full bake when they change, edits to anything else than keys count as well """
+    _obj = bpy.data.objects[anmx.onion_object]
+    actions = tuple(keyobj.animation_data.action.name for keyobj in get_keyobjs(_obj))
+    objects = tuple(obj.name for obj in extra_objects())
+    return (anmx.onion_object, objects, actions, anmx.onion_mode, anmx.skin_step, anmx.bake_window, anmx.store_precision, anmx.fast_armature, anmx.fast_transform, anmx.dedupe_frames, anmx.dedupe_epsilon,
+            anmx.reduce_bake, anmx.bake_subdiv_cap, anmx.bake_skip_modifiers, anmx.ghost_style == "MESH", anmx.point_count,
+            input_digest(_obj))
+
+
+def cache_folder():
+    """ Folder next to the .blend file holding the onion cache, None when the file is not saved """
+    if not bpy.data.filepath:
+        return None
+    return bpy.path.abspath("//animextras_cache")
+
+
+def cache_name(_obj):
+    """ Name of the object's cache entries, every onion mode keeps its own entry """
+    return "{}_{}".format(_obj.name, bpy.context.scene.anmx_data.onion_mode)
+
+
+def cache_key(_obj):
+    """ Hashes everything the baked frames of the object depend on, the vertices and modifier settings included """
+    anmx = bpy.context.scene.anmx_data
+    parts = [anmx.onion_mode, anmx.skin_step, anmx.reduce_bake, anmx.bake_subdiv_cap, anmx.bake_skip_modifiers, anmx.ghost_style == "MESH", anmx.point_count, input_digest(_obj)]
+    
+    for obj in [_obj] + extra_objects():
+        mesh = obj.data
+        loops = np.empty(len(mesh.loops), 'i')
+        mesh.loops.foreach_get("vertex_index", loops)
+        
+        parts += [obj.name, len(mesh.vertices), loops]
+        parts += [(m.name, m.type, m.show_viewport) for m in obj.modifiers]
+    
+    keys = key_snapshot(snapshot_objects(_obj))
+    for path in sorted(keys):
+        parts += [path, keys[path][0], keys[path][1]]
+    
+    return cache.make_key(parts)
+
+
+def can_cache(_obj):
+    # The transform fast path is quicker than reading a cache
+    return _obj.type == 'MESH' and cache_folder() is not None and not transform_only(_obj)
+
+
+def use_cache(_obj):
+    anmx = bpy.context.scene.anmx_data
+    return anmx.use_disk_cache and can_cache(_obj)
+
+
+def load_cache(_obj):
+    """ Fills frame_data from the disk cache, returns False when the disk cache is off or has no valid entry for the object """
+    if not use_cache(_obj) or not os.path.isdir(cache_folder()):
+        return False
+    
+    with perf.timed("cache_load"):
+        frames = cache.load(cache_folder(), cache_name(_obj), cache_key(_obj))
+    if frames is None:
+        return False
+    
+    anmx = bpy.context.scene.anmx_data
+    clear_data()
+    
+    # Cached frames are views into the mapped files just like the frames of a parallel bake
+    for f in sorted(frames):
+        vertices, indices = frames[f]
+        store_frame(frame_data, str(f), vertices, indices, anmx.store_precision)
+    
+    keyframes = get_keyframes(_obj)
+    remember_bake(anmx, mode_frames(anmx, keyframes), keyframes)
+    return True
+
+
+def save_cache(_obj):
+    """ Writes the frames of a full bake to the disk cache, windowed bakes are never complete so they are not saved """
+    anmx = bpy.context.scene.anmx_data
+    if not use_cache(_obj) or anmx.bake_window or not frame_data:
+        return
+    
+    frames = dict([])
+    for key, arg in frame_data.items():
+        frames[int(key)] = [frame_vertices(arg), arg[1]]
+    
+    with perf.timed("cache_save"):
+        cache.save(cache_folder(), cache_name(_obj), cache_key(_obj), frames)
 
-    # Getting the Depenency Graph and the evaluated object
-    depsgraph = bpy.context.evaluated_depsgraph_get()
-    eval = tmpobj.evaluated_get(depsgraph)
 
-    # Making a new mesh from the object.
-    mesh = eval.to_mesh()
-    mesh.update()
+def worker_count(_obj, frames):
+    """ Number of Blender processes the frames are baked with, 0 bakes them in place """
+    anmx = bpy.context.scene.anmx_data
     
-    # Getting the object's world matrix
-    mat = Matrix(_obj.matrix_world)
+    # Linked rigs are made local while baking their first frame so they can't be baked by workers,
+    # windowed bakes are a few frames and are over before the workers have loaded the file
+    if not anmx.parallel_bake or anmx.bake_window or _obj.type == 'EMPTY' or transform_only(_obj):
+        return 0
+    return workers.worker_count(len(frames), anmx.bake_workers)
+
+
+def bake_workers(_obj, frames, target=None, count=None):
+    """ Bakes the frames with headless Blender processes working on a copy of the file, each doing a slice of the frames """
+    if target is None:
+        target = frame_data
+    anmx = bpy.context.scene.anmx_data
+    if count is None:
+        count = anmx.bake_workers
     
-    # This moves the mesh by the object's world matrix, thus making everything global space. This is much faster than getting each vertex individually and doing a matrix multiplication on it
-    mesh.transform(mat)
-    mesh.update()
+    folder = tempfile.mkdtemp(prefix="animextras_")
+    worker_folders.append(folder)
     
-    # loop triangles are needed to properly draw the mesh on screen
-    mesh.calc_loop_triangles()
-    mesh.update()
+    # A copy is saved so the workers see the file as it is now, saved or not, with the modifiers reduced for the bake
+    blend = os.path.join(folder, "bake.blend")
+    changed = reduce_modifiers([_obj] + extra_objects())
+    try:
+        bpy.ops.wm.save_as_mainfile(filepath=blend, copy=True)
+    finally:
+        restore_modifiers(changed)
     
-    # Creating empties so that all of the verts and indices can be gathered all at once in the next step
-    vertices = np.empty((len(mesh.vertices), 3), 'f')
-    indices = np.empty((len(mesh.loop_triangles), 3), 'i')
+    package = __package__
+    path = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
     
-    # Getting all of the vertices and incices all at once (from: https://docs.blender.org/api/current/gpu.html#mesh-with-random-vertex-colors)
-    mesh.vertices.foreach_get(
-        "co", np.reshape(vertices, len(mesh.vertices) * 3))
-    mesh.loop_triangles.foreach_get(
-        "vertices", np.reshape(indices, len(mesh.loop_triangles) * 3))
+    names = [obj.name for obj in [_obj] + extra_objects()]
     
-    args = [vertices, indices]
+    def launch(folder, index, part):
+        return subprocess.Popen(workers.blender_command(bpy.app.binary_path, blend, folder, index, part, names, package, path))
     
-    # Hide from viewport > keep off this allows in_front to work
-    # if "_animextras" in scn.collection.children:
-    #     vlayer = scn.view_layers['View Layer']
-    #     vlayer.layer_collection.children['_animextras'].hide_viewport = True
-
-    return args
+    results = workers.bake_parallel(frames, count, folder, launch)
+    
+    # Results are views into the mapped files, only packing makes a copy
+    for f in frames:
+        vertices, indices = results[f]
+        store_frame(target, str(f), vertices, indices, anmx.store_precision)
 
 
-def set_to_active(_obj):
-    """ Sets the object that is being used for the onion skinning """
+def bake_list(_obj, frames, target=None):
+    """ Bakes the given frames into frame_data, or into target, and returns to the current frame afterwards """
+    global baking
+    if target is None:
+        target = frame_data
+    
+    # Touching the modifiers for nothing would make the depsgraph update and trigger an auto update
+    if not frames:
+        return
+    
+    objs = [_obj] + extra_objects()
+    
+    # Nothing has to be evaluated for objects that only move, their matrices come straight from the F-curves
+    if transform_only(_obj):
+        baking = True
+        changed = reduce_modifiers(objs)
+        try:
+            bake_transforms(_obj, frames, target)
+        finally:
+            restore_modifiers(changed)
+            baking = False
+        return
+    
     scn = bpy.context.scene
-    anmx = scn.anmx_data
+    precision = scn.anmx_data.store_precision
+    curr = scn.frame_current
     
-    # Clear all data > caused double drawing with mode switch
-    # Old clear method caused issues when using a rig
-    # Still see handler issue
-    frame_data.clear()
-    batches.clear()
-    extern_data.clear()
+    pool = None
+    reuse = None
+    used = 0
+    
+    baking = True
+    changed = []
+    try:
+        mute_skinned(objs, True)
+        changed = reduce_modifiers(objs)
+        for i, f in enumerate(frames):
+            slot = reuse
+            if pool is not None:
+                chunk, index = divmod(used, pool_chunk)
+                if chunk == len(pool):
+                    pool.append(np.empty((min(pool_chunk, len(frames) - i),) + pool[0].shape[1:], 'f'))
+                slot = pool[chunk][index]
+            vertices, indices = frame_get_set(_obj, f, slot)
+            
+            # Once the first frame tells the vertex count, full precision frames are read straight into pool slots,
+            # packed and sampled frames are read into one buffer reused by every frame. Frames of another vertex count get their own array
+            if i == 0 and len(frames) > 1:
+                if precision == "FULL" and scn.anmx_data.ghost_style == "MESH":
+                    pool = [np.empty((min(pool_chunk, len(frames)),) + vertices.shape, 'f')]
+                    pool[0][0] = vertices
+                    vertices = slot = pool[0][0]
+                else:
+                    reuse = np.empty(vertices.shape, 'f')
+            
+            # Slots of frames that share the pose of an earlier frame are used by the next frame, so the pool grows with the distinct poses
+            with perf.timed("pack"):
+                if store_frame(target, str(f), vertices, indices, precision, reuse) and pool is not None and vertices is slot:
+                    used += 1
+    finally:
+        restore_modifiers(changed)
+        mute_skinned(objs, False)
+        scn.frame_set(curr)
+        baking = False
+
+
+def store_frame(target, key, vertices, indices, precision, reuse=None):
+    """ Stores a baked frame, returns False when it has the pose of a frame baked before and shares its arrays instead """
+    anmx = bpy.context.scene.anmx_data
+    vertices, indices = sample_frame(vertices, indices)
+    indices = share_indices(indices)
+    forget_pose(key)
+    
+    if anmx.dedupe_frames:
+        digest = pose_digest(vertices, indices, anmx.dedupe_epsilon)
+        twin = poses.get(digest)
+        arg = None if twin is None else target.get(twin) or frame_data.get(twin)
+        if arg is not None:
+            target[key] = arg
+            twins[key] = twin
+            return False
+        
+        poses[digest] = key
+        frame_poses[key] = digest
+    
+    packed = pack_vertices(vertices, precision)
+    
+    # Frames that can't be packed keep their own copy of the reused buffer
+    if packed is reuse:
+        packed = reuse.copy()
+    target[key] = [packed, indices]
+    return True
 
-    # skip clear if we are linked
-    if hasattr(anmx,"link_parent"):
-        if not anmx.link_parent == "":
-            clear_active(clrRig=False)
 
-    anmx.onion_object = _obj.name
-    anmx.is_linked = True if _obj.type == 'EMPTY' else False
+def pose_digest(vertices, indices, epsilon):
+    """ Hashes the pose of a frame, vertices are rounded to epsilon so near identical poses hash the same """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str(vertices.shape).encode())
     
-    if anmx.is_linked:
-        if hasattr(anmx,"link_parent"):
-            if not anmx.link_parent:
-                anmx.link_parent = _obj.name
+    data = vertices if epsilon <= 0 else np.round(vertices / epsilon).astype(np.int64)
+    h.update(np.ascontiguousarray(data).tobytes())
+    
+    # Frames with the shared topology don't need their indices hashed
+    h.update(b"shared" if indices is topology.get("indices") else np.ascontiguousarray(indices).tobytes())
+    return h.digest()
 
-    bake_frames()
-    make_batches()
 
+def forget_pose(key):
+    """ Removes the frame from the pose index, frames with its pose no longer share its arrays """
+    twins.pop(key, None)
+    digest = frame_poses.pop(key, None)
+    if digest is not None and poses.get(digest) == key:
+        del poses[digest]
 
-def clear_active(clrRig):
-    """ clrRig will do complete clear, sued with linked Rigs, allows to update it without deleting everuthing """
-    """ Clears the active object """ 
 
-    scn = bpy.context.scene
-    anmx = scn.anmx_data
-    name = anmx.onion_object
+def remember_bake(anmx, frames, keyframes, keys=None):
+    """ Stores what the last bake was made from, used by the windowed bake and by incremental updates """
+    _obj = bpy.data.objects[anmx.onion_object]
+    if keys is None:
+        keys = key_snapshot(snapshot_objects(_obj))
     
-    # Clears all the data needed to store onion skins on the previously selected object
-    frame_data.clear()
-    batches.clear()
     extern_data.clear()
+    if anmx.onion_mode == "INB":
+        for fkey in keyframes:
+            extern_data[str(fkey)] = fkey
     
-    # Clear localzed rigs & overrides linked items
-    if clrRig:
-        if hasattr(anmx,"link_parent"):
-            if not anmx.link_parent == "":
-                bpy.data.collections["_animextras"].children[0].objects.unlink(bpy.data.objects[name])
-                bpy.data.collections.remove(bpy.data.collections[anmx.link_parent])
-                bpy.data.collections.remove(bpy.data.collections["_animextras"])
-                # Show original linked rig again
-                bpy.data.objects[anmx.link_parent].hide_viewport = False
-                anmx.link_parent = ""
-
-    # Gets rid of the selected object
-    anmx.onion_object = ""
+    bake_info["frames"] = frames
+    bake_info["keys"] = keys
+    bake_info["settings"] = bake_settings(anmx)
 
 
-def make_batches():
-    # Custom OSL shader could be set here
+def bake_frames():
+    # Needs to do the following:
+    # 1. Bake the data for every frame and store it in the objects "["frame_data"]" items
     scn = bpy.context.scene
     anmx = scn.anmx_data
     _obj = bpy.data.objects[anmx.onion_object]
     
+    # Getting the first and last frame of the animation
+    keyframes = get_keyframes(_obj)
+    frames = mode_frames(anmx, keyframes)
     
-    for key in frame_data:
-        arg = frame_data[key]  # Dictionaries are used rather than lists or arrays so that frame numbers are a given
-        vertices = arg[0]
-        indices = arg[1]
-        batch = batch_for_shader(shader, 'TRIS', {"pos": vertices}, indices=indices)
-        batches[key] = batch
-        
+    wanted = wanted_frames(anmx, frames)
+    
+    count = worker_count(_obj, wanted)
+    if count:
+        bake_workers(_obj, wanted, count=count)
+    else:
+        bake_list(_obj, wanted)
+    
+    # Linked rigs only have their onion object after the first frame is baked
+    remember_bake(anmx, frames, keyframes)
 
-def bake_frames():
-    # Needs to do the following:
-    # 1. Bake the data for every frame and store it in the objects "["frame_data"]" items
+
+def update_active():
+    """ Re-bakes only the frames affected by the keys that changed since the last bake """
     scn = bpy.context.scene
     anmx = scn.anmx_data
     _obj = bpy.data.objects[anmx.onion_object]
     
+    cancel_bake()
+    
+    # Anything else than changed keys needs the full bake, so do objects of the transform fast path as it only evaluates F-curves
+    if not anmx.incremental_update or "keys" not in bake_info or bake_info["settings"] != bake_settings(anmx) or transform_only(_obj):
+        set_to_active(_obj)
+        return
+    
+    perf.reset(draw=False)
+    keys = key_snapshot(snapshot_objects(_obj))
+    ranges = dirty_ranges(bake_info["keys"], keys)
+    
+    keyframes = get_keyframes(_obj)
+    frames = mode_frames(anmx, keyframes)
+    
+    # Frames that are no longer part of the animation
+    valid = set(frames)
+    for key in list(frame_data):
+        if int(key) not in valid:
+            del frame_data[key]
+            drop_batch(key)
+    
+    wanted = wanted_frames(anmx, frames)
+    
+    # Held frames inside a changed range are re-baked, missing frames of the window are filled in
+    wanted = set(wanted)
+    dirty = [f for f in frames if (str(f) in frame_data and any(start <= f <= end for start, end in ranges)) or (f in wanted and str(f) not in frame_data)]
+    
+    if anmx.background_bake:
+        start_bake(_obj, dirty, frames, keyframes, full=False, keys=keys)
+        return
+    
+    # The disk cache is only written by full bakes, saving here would rewrite the whole entry on every edit
+    # and prune the entry the frames that were not re-baked may still be mapped from
+    bake_list(_obj, dirty)
+    remember_bake(anmx, frames, keyframes, keys)
+    make_batches([str(f) for f in dirty])
+
+
+def update_window(scn):
+    """ Bakes the frames that moved into the window and drops the ones far outside of it """
+    anmx = scn.anmx_data
+    _obj = bpy.data.objects[anmx.onion_object]
+    
     curr = scn.frame_current
-    step = anmx.skin_step
+    radius = window_radius(anmx)
     
-    # Getting the first and last frame of the animation
-    keyobj = _obj
+    # Dropping frames far outside of the window so memory stays bound to the window size
+    for key in list(frame_data):
+        if abs(int(key) - curr) > radius * window_margin:
+            del frame_data[key]
+            drop_batch(key)
     
-    if _obj.parent is not None:
-        keyobj = _obj.parent
-    # Check if obj is linked rig
-    elif hasattr(_obj.instance_collection, "all_objects"):
-        keyobj = _obj.instance_collection.all_objects[_obj.name]
-        # print(keyobj)
-        # keyobj = _obj.parent
+    missing = [f for f in window_frames(bake_info["frames"], curr, radius) if str(f) not in frame_data]
+    if not missing:
+        return
+    
+    bake_list(_obj, missing)
+    make_batches([str(f) for f in missing])
 
-    keyframes = []
-    for fc in keyobj.animation_data.action.fcurves:
-        for k in fc.keyframe_points:
-            keyframes.append(int(k.co[0]))
-            
-    keyframes = np.unique(keyframes)
 
-    start = int(np.min(keyframes))
-    end = int(np.max(keyframes)) + 1
+def tag_redraw():
+    """ Redraws the 3D views so ghosts and the panel show the latest state """
+    for window in bpy.context.window_manager.windows:
+        for area in window.screen.areas:
+            if area.type == 'VIEW_3D':
+                area.tag_redraw()
+
+
+def start_bake(_obj, frames, all_frames, keyframes, full, keys=None):
+    """ Starts baking the frames in the background, a few frames per timer tick """
+    if keys is None:
+        keys = key_snapshot(snapshot_objects(_obj))
     
-    if anmx.onion_mode == "PF":
-        for f in range(start, end):
-            arg = frame_get_set(_obj, f)
-            frame_data[str(f)] = arg
-        extern_data.clear()
-        
-    elif anmx.onion_mode == "PFS":
-        for f in range(start, end, step):
-            arg = frame_get_set(_obj, f)
-            frame_data[str(f)] = arg
-        extern_data.clear()
-        
-    elif anmx.onion_mode == "DC":
-        for fkey in keyframes:
-            arg = frame_get_set(_obj, fkey)
-            frame_data[str(fkey)] = arg
-        extern_data.clear()
+    bake_job["object"] = _obj.name
+    bake_job["frames"] = list(frames)
+    bake_job["done"] = 0
+    bake_job["staged"] = dict([])
+    bake_job["full"] = full
+    bake_job["all_frames"] = all_frames
+    bake_job["keyframes"] = keyframes
+    bake_job["keys"] = keys
+    
+    bpy.app.timers.register(bake_tick)
+
+
+def bake_tick():
+    """ Bakes the next chunk of the background bake, returns the delay until the next tick """
+    if not bake_job:
+        return None
+    
+    anmx = bpy.context.scene.anmx_data
+    if bake_job["object"] not in bpy.data.objects:
+        cancel_bake()
+        return None
+    
+    _obj = bpy.data.objects[bake_job["object"]]
+    done = bake_job["done"]
+    chunk = bake_job["frames"][done:done + anmx.bake_chunk]
+    
+    # A failing chunk ends the job, otherwise the panel shows it baking and Update stays blocked forever
+    try:
+        # New frames go to the staging dict, their batches are published right away so ghosts show up while baking
+        bake_list(_obj, chunk, bake_job["staged"])
+        make_batches([str(f) for f in chunk], bake_job["staged"])
+        bake_job["done"] = done + len(chunk)
         
-    elif anmx.onion_mode == "INB":
-        for f in range(start, end):
-            arg = frame_get_set(_obj, f)
-            frame_data[str(f)] = arg
+        if bake_job["done"] >= len(bake_job["frames"]):
+            finish_bake()
+    except Exception:
+        cancel_bake()
+        raise
+    
+    tag_redraw()
+    return 0.0 if bake_job else None
 
-        extern_data.clear()
-        for fkey in keyframes: 
-            extern_data[str(fkey)] = fkey
+
+def finish_bake():
+    """ Moves the baked frames of the background bake into frame_data """
+    anmx = bpy.context.scene.anmx_data
+    staged = bake_job["staged"]
+    
+    frame_data.update(staged)
+    
+    # A full bake replaces everything, frames it did not bake belong to old settings
+    if bake_job["full"]:
+        for key in list(frame_data):
+            if key not in staged:
+                del frame_data[key]
+                drop_batch(key)
+    
+    remember_bake(anmx, bake_job["all_frames"], bake_job["keyframes"], bake_job["keys"])
+    if bake_job["full"]:
+        save_cache(bpy.data.objects[bake_job["object"]])
+    bake_job.clear()
+
+
+def cancel_bake():
+    """ Stops the background bake, frame_data is left as it was before the bake started """
+    if not bake_job:
+        return
+    
+    if bpy.app.timers.is_registered(bake_tick):
+        bpy.app.timers.unregister(bake_tick)
+    
+    # Poses of the staged frames are not the poses of frame_data
+    for key in bake_job["staged"]:
+        forget_pose(key)
+    
+    # Batches that were published already are put back to the frames they replaced
+    for key in bake_job["staged"]:
+        if key in frame_data:
+            make_batches([key])
+        else:
+            drop_batch(key)
+    
+    bake_job.clear()
+
+
+def watched_ids(_obj):
+    """ Names of the objects and actions whose edits change the onion skins, targets of modifiers, constraints and drivers included """
+    names = set(o.name for o in [_obj] + extra_objects() + dependency_objects(_obj))
+    for keyobj in snapshot_objects(_obj):
+        names.add(keyobj.name)
+        if keyobj.animation_data is not None and keyobj.animation_data.action is not None:
+            names.add(keyobj.animation_data.action.name)
+    return names
+
+
+@persistent
+def ANMX_key_handler(scn, depsgraph):
+    """ Drops the cached keys of edited actions and the weights of edited meshes """
+    for update in depsgraph.updates:
+        if isinstance(update.id, bpy.types.Action):
+            key_index.pop(update.id.original.name, None)
+        elif isinstance(update.id, bpy.types.Mesh):
+            vertex_weights.pop(update.id.original.name, None)
+
+
+@persistent
+def ANMX_undo_handler(scn, *args):
+    """ Undo can bring back any state of the actions and meshes, all cached keys and weights are dropped """
+    key_index.clear()
+    vertex_weights.clear()
+
+
+def unkeyed_changes(_obj):
+    """ True when an animated property differs from what its F-curve gives on the current frame, posing that is not keyed yet """
+    frame = bpy.context.scene.frame_current
+    for keyobj in snapshot_objects(_obj):
+        for fc in keyobj.animation_data.action.fcurves:
+            if fc.mute:
+                continue
+            try:
+                value = keyobj.path_resolve(fc.data_path)
+            except ValueError:
+                continue
+            if hasattr(value, "__len__"):
+                value = value[fc.array_index]
+            if abs(value - fc.evaluate(frame)) > 1e-4:
+                return True
+    return False
+
+
+def auto_tick():
+    """ Updates the onion skins once the edits have settled """
+    anmx = bpy.context.scene.anmx_data
+    if not (anmx.auto_update and anmx.onion_object in bpy.data.objects and "frames" in bake_info):
+        return None
+    
+    # Baking changes frames, which would throw away posing that is not keyed yet, keying it schedules the update again
+    if unkeyed_changes(bpy.data.objects[anmx.onion_object]):
+        return None
+    
+    update_active()
+    tag_redraw()
+    return None
+
+
+def cancel_auto():
+    """ Drops a pending auto update """
+    if bpy.app.timers.is_registered(auto_tick):
+        bpy.app.timers.unregister(auto_tick)
+
+
+@persistent
+def ANMX_auto_handler(scn, depsgraph):
+    """ Schedules an update when the actions of the onion objects or their targets are edited, every new edit restarts the delay """
+    anmx = scn.anmx_data
+    if baking or not anmx.auto_update or "frames" not in bake_info:
+        return
+    if anmx.onion_object not in bpy.data.objects:
+        return
+    
+    # Only key edits count, posing updates the objects on every change and isn't baked until it is keyed
+    updates = [u.id.original.name for u in depsgraph.updates if isinstance(u.id, bpy.types.Action)]
+    if not updates:
+        return
+    
+    watched = watched_ids(bpy.data.objects[anmx.onion_object])
+    if not any(name in watched for name in updates):
+        return
+    
+    cancel_auto()
+    bpy.app.timers.register(auto_tick, first_interval=anmx.auto_update_delay)
 
 
-    scn.frame_set(curr)
+@persistent
+def ANMX_render_start(scn, *args):
+    global rendering
+    rendering = True
+
+
+@persistent
+def ANMX_render_end(scn, *args):
+    global rendering
+    rendering = False
+
+
+@persistent
+def ANMX_window_handler(scn):
+    """ Fills in the windowed bake as the current frame changes, frames changed by a render are left alone """
+    anmx = scn.anmx_data
+    if baking or rendering or bake_job or not anmx.bake_window or "frames" not in bake_info:
+        return
+    if anmx.onion_object not in bpy.data.objects:
+        return
+    
+    update_window(scn)
     
 
 # ################ #
@@ -255,6 +2122,11 @@ def bake_frames():
 # ################ #
 
 
+class ANMX_object(PropertyGroup):
+    """ An extra mesh that is onion skinned together with the onion object, only uses the name """
+    pass
+
+
 class ANMX_data(PropertyGroup):
     # Custom update function for the toggle
     def toggle_update(self, context):
@@ -262,6 +2134,19 @@ class ANMX_data(PropertyGroup):
             bpy.ops.anim_extras.draw_meshes('INVOKE_DEFAULT')
         return
 
+    def colors_update(self, context):
+        draw_data.pop("colors", None)
+        return
+
+    def lod_update(self, context):
+        reset_lod()
+        return
+
+    def style_update(self, context):
+        # Switching between points and trails only builds the batches again, meshes need a new bake
+        reset_lod()
+        return
+
     def inFront(self,context):
         scn = bpy.context.scene
         if self.onion_object:
@@ -272,6 +2157,12 @@ class ANMX_data(PropertyGroup):
                     scn["anmx_data"]["use_xray"] = False if scn["anmx_data"]["in_front"] else True
         return
 
+    styles = [
+        ("MESH", "Mesh", "Ghosts are the full meshes", 1),
+        ("POINTS", "Points", "Ghosts are a sample of the vertices drawn as points, memory and drawing only depend on the sample size", 2),
+        ("TRAILS", "Trails", "A sample of the vertices is drawn as lines to where they are on the next baked frame, showing the arcs of the motion", 3),
+        ]
+
     modes = [
         ("PF", "Per-Frame", "Shows the amount of frames in the future and past", 1), 
         ("PFS", "Per-Frame Stepped", "Shows the amount of frames in the future and past with option to step-over frames. This allows to see futher but still have a clear overview what is happening", 2), 
@@ -280,30 +2171,59 @@ class ANMX_data(PropertyGroup):
         ]
 
     # Onion Skinning Properties
-    skin_count: bpy.props.IntProperty(name="Count", description="Number of frames we see in past and future", default=1, min=1)
+    skin_count: bpy.props.IntProperty(name="Count", description="Number of frames we see in past and future", default=1, min=1, update=colors_update)
     skin_step: bpy.props.IntProperty(name="Step", description="Number of frames to skip in conjuction with Count", default=1, min=1)
     onion_object: bpy.props.StringProperty(name="Onion Object", default="")
-    onion_mode: bpy.props.EnumProperty(name="", get=None, set=None, items=modes)
+    extra_objects: bpy.props.CollectionProperty(type=ANMX_object)
+    onion_mode: bpy.props.EnumProperty(name="", get=None, set=None, items=modes, update=colors_update)
     use_xray: bpy.props.BoolProperty(name="Use X-Ray", description="Draws the onion visible through the object", default=False)
     use_flat: bpy.props.BoolProperty(name="Flat Colors", description="Colors while not use opacity showing 100% of the color", default=False)
     in_front: bpy.props.BoolProperty(name="In Front", description="Draws the selected object in front of the onion skinning", default=False, update=inFront)
     toggle: bpy.props.BoolProperty(name="Draw", description="Toggles onion skinning on or off", default=False, update=toggle_update)
+    bake_window: bpy.props.BoolProperty(name="Windowed Bake", description="Only bakes the frames around the current frame and bakes more as the current frame changes", default=False)
+    use_governor: bpy.props.BoolProperty(name="Keep Playback Speed", description="Draws fewer or coarser ghosts while playing when drawing them takes longer than the budget, full quality is restored when playback stops", default=False)
+    draw_budget: bpy.props.FloatProperty(name="Draw Budget (ms)", description="Milliseconds drawing the ghosts may take per redraw during playback", default=8.0, min=0.5, soft_max=40.0)
+    use_stash: bpy.props.BoolProperty(name="Keep Other Objects", description="Keeps the onion skins of previous onion objects so switching back to them doesn't bake again", default=True)
+    stash_budget: bpy.props.IntProperty(name="Memory Budget (MB)", description="Memory the onion skins of previous onion objects may take, the least recently used are dropped first", default=1024, min=0, soft_max=16384)
+    show_perf: bpy.props.BoolProperty(name="Performance", description="Shows the timings of the last bake and of drawing", default=False)
+    use_lod: bpy.props.BoolProperty(name="Simplify Ghosts", description="Ghosts of meshes over the triangle budget are drawn simplified", default=False, update=lod_update)
+    lod_budget: bpy.props.IntProperty(name="Triangle Budget", description="Most triangles a simplified ghost is drawn with", default=20000, min=100, soft_max=200000, update=lod_update)
+    lod_falloff: bpy.props.BoolProperty(name="Distance Falloff", description="Ghosts further from the current frame are simplified more", default=True, update=lod_update)
+    store_precision: bpy.props.EnumProperty(name="Storage", description="Precision the baked frames are stored with, lower precision uses less memory", items=store.precisions)
+    background_bake: bpy.props.BoolProperty(name="Background Bake", description="Bakes a few frames at a time so Blender stays responsive, ghosts show up as they are baked", default=False)
+    bake_chunk: bpy.props.IntProperty(name="Frames Per Step", description="Number of frames the background bake does before giving control back to Blender", default=4, min=1)
+    parallel_bake: bpy.props.BoolProperty(name="Parallel Bake", description="Splits full bakes over headless Blender processes running on a copy of the file", default=False)
+    bake_workers: bpy.props.IntProperty(name="Workers", description="Number of Blender processes used by the parallel bake", default=max(1, (os.cpu_count() or 2) // 2), min=1)
+    use_disk_cache: bpy.props.BoolProperty(name="Disk Cache", description="Saves baked frames in a folder next to the .blend file and loads them instead of baking when nothing changed", default=False)
+    dedupe_frames: bpy.props.BoolProperty(name="Share Held Poses", description="Frames with the same pose, like holds and stepped keys, share one stored mesh and one batch", default=True)
+    dedupe_epsilon: bpy.props.FloatProperty(name="Pose Tolerance", description="Distance vertices may differ by for frames to count as the same pose, 0 only shares identical frames", default=1e-5, min=0.0, soft_max=0.01, precision=6, subtype='DISTANCE')
+    fast_transform: bpy.props.BoolProperty(name="Fast Transform Bake", description="Objects that only move by their own or their parent's keyed transforms bake a matrix per frame instead of a mesh", default=True)
+    reduce_bake: bpy.props.BoolProperty(name="Reduce Resolution", description="Bakes with subdivision levels capped and the listed modifiers turned off, they are put back after the bake", default=False)
+    bake_subdiv_cap: bpy.props.IntProperty(name="Max Subdivisions", description="Highest Subdivision Surface or Multiresolution viewport level used for the bake", default=0, min=0, max=6)
+    bake_skip_modifiers: bpy.props.StringProperty(name="Skip Modifiers", description="Modifiers turned off for the bake, names or types like SOLIDIFY separated by commas", default="")
+    ghost_style: bpy.props.EnumProperty(name="Ghosts", description="How the ghosts are drawn, switching to or from meshes needs a new bake", items=styles, update=style_update)
+    point_count: bpy.props.IntProperty(name="Sample Size", description="Number of vertices point and trail ghosts keep of every frame", default=2000, min=16, soft_max=100000)
+    point_size: bpy.props.FloatProperty(name="Point Size", description="Size of point ghosts in pixels", default=3.0, min=1.0, max=10.0)
+    fast_armature: bpy.props.BoolProperty(name="Fast Armature Bake", description="Meshes only deformed by an armature are skinned from the pose with NumPy instead of evaluating their modifiers", default=False)
+    auto_update: bpy.props.BoolProperty(name="Auto Update", description="Updates the onion skins shortly after keys of the onion objects are edited, posing is left alone until it is keyed", default=False)
+    auto_update_delay: bpy.props.FloatProperty(name="Delay", description="Seconds without edits before the onion skins are updated", default=0.4, min=0.05, max=5.0, subtype='TIME', unit='TIME')
+    incremental_update: bpy.props.BoolProperty(name="Incremental Update", description="Update only re-bakes the frames affected by keys that changed since the last bake", default=True)
     
     # Linked settings
     is_linked: bpy.props.BoolProperty(name="Is linked", default=False)
     link_parent: bpy.props.StringProperty(name="Link Parent", default="")
 
     # Past settings
-    past_color: bpy.props.FloatVectorProperty(name="Past Color", min=0, max=1, size=3, default=(1., .1, .1), subtype='COLOR')
-    past_opacity_start: bpy.props.FloatProperty(name="Starting Opacity", min=0, max=1, precision=2, default=0.5)
-    past_opacity_end: bpy.props.FloatProperty(name="Ending Opacity", min=0, max=1, precision=2, default=0.1)
-    past_enabled: bpy.props.BoolProperty(name="Enabled?", default=True)
+    past_color: bpy.props.FloatVectorProperty(name="Past Color", min=0, max=1, size=3, default=(1., .1, .1), subtype='COLOR', update=colors_update)
+    past_opacity_start: bpy.props.FloatProperty(name="Starting Opacity", min=0, max=1, precision=2, default=0.5, update=colors_update)
+    past_opacity_end: bpy.props.FloatProperty(name="Ending Opacity", min=0, max=1, precision=2, default=0.1, update=colors_update)
+    past_enabled: bpy.props.BoolProperty(name="Enabled?", default=True, update=colors_update)
     
     # Future settings
-    future_color: bpy.props.FloatVectorProperty(name="Future Color", min=0, max=1, size=3, default=(.1, .4, 1.), subtype='COLOR')
-    future_opacity_start: bpy.props.FloatProperty(name="Starting Opacity", min=0, max=1,precision=2, default=0.5)
-    future_opacity_end: bpy.props.FloatProperty(name="Ending Opacity", min=0, max=1,precision=2, default=0.1)
-    future_enabled: bpy.props.BoolProperty(name="Enabled?", default=True)
+    future_color: bpy.props.FloatVectorProperty(name="Future Color", min=0, max=1, size=3, default=(.1, .4, 1.), subtype='COLOR', update=colors_update)
+    future_opacity_start: bpy.props.FloatProperty(name="Starting Opacity", min=0, max=1,precision=2, default=0.5, update=colors_update)
+    future_opacity_end: bpy.props.FloatProperty(name="Ending Opacity", min=0, max=1,precision=2, default=0.1, update=colors_update)
+    future_enabled: bpy.props.BoolProperty(name="Enabled?", default=True, update=colors_update)
 
 
 # ################ #
@@ -427,6 +2347,85 @@ class ANMX_add_clear_onion(Operator):
         return {"FINISHED"}
 
 
+class ANMX_add_onion_objects(Operator):
+    bl_idname = "anim_extras.add_onion_objects"
+    bl_label = "Add Selected Objects"
+    bl_description = "Adds the selected meshes so they are onion skinned together with the onion object"
+    bl_options = {'REGISTER', 'UNDO' }
+    
+    @classmethod
+    def poll(cls, context):
+        return context.scene.anmx_data.onion_object in bpy.data.objects
+    
+    def execute(self, context):
+        anmx = context.scene.anmx_data
+        
+        added = 0
+        for obj in context.selected_objects:
+            if obj.type == 'MESH' and obj.name != anmx.onion_object and obj.name not in anmx.extra_objects:
+                item = anmx.extra_objects.add()
+                item.name = obj.name
+                added += 1
+        
+        if not added:
+            self.report({'INFO'}, "Select meshes other than the onion object to add them")
+            return {'CANCELLED'}
+        
+        update_active()
+    
+        return {"FINISHED"}
+
+
+class ANMX_remove_onion_object(Operator):
+    bl_idname = "anim_extras.remove_onion_object"
+    bl_label = "Remove Object"
+    bl_description = "Stops onion skinning this object"
+    bl_options = {'REGISTER', 'UNDO' }
+    
+    index: bpy.props.IntProperty()
+    
+    def execute(self, context):
+        anmx = context.scene.anmx_data
+        anmx.extra_objects.remove(self.index)
+        
+        if anmx.onion_object in bpy.data.objects:
+            update_active()
+    
+        return {"FINISHED"}
+
+
+class ANMX_cancel_bake(Operator):
+    bl_idname = "anim_extras.cancel_bake"
+    bl_label = "Cancel Bake"
+    bl_description = "Stops the background bake and keeps the onion skins from before it"
+    bl_options = {'REGISTER'}
+    
+    def execute(self, context):
+        cancel_bake()
+        tag_redraw()
+    
+        return {"FINISHED"}
+
+
+class ANMX_dump_perf(Operator):
+    bl_idname = "anim_extras.dump_perf"
+    bl_label = "Save Performance Report"
+    bl_description = "Saves the timings of the last bake and of drawing as JSON"
+    bl_options = {'REGISTER'}
+    
+    filepath: bpy.props.StringProperty(subtype='FILE_PATH', default="animextras_perf.json")
+    
+    def invoke(self, context, event):
+        context.window_manager.fileselect_add(self)
+        return {'RUNNING_MODAL'}
+    
+    def execute(self, context):
+        perf.dump(bpy.path.abspath(self.filepath), perf_extra())
+        self.report({'INFO'}, "Saved " + self.filepath)
+    
+        return {"FINISHED"}
+
+
 class ANMX_update_onion(Operator):
     bl_idname = "anim_extras.update_onion"
     bl_label = "Update Selected Onion"
@@ -441,7 +2440,7 @@ class ANMX_update_onion(Operator):
 
         # This allows to update, also pose mode
         if context.scene.anmx_data.onion_object in bpy.data.objects:
-            set_to_active(bpy.data.objects[context.scene.anmx_data.onion_object])
+            update_active()
     
         return {"FINISHED"}
 
@@ -498,63 +2497,132 @@ class ANMX_draw_meshes(Operator):
         return {'FINISHED'}
     
     def draw_callback(self, context):
-        scn = context.scene
-        ac = scn.anmx_data
-        f = scn.frame_current
-
-        pc = ac.past_color
-        fc = ac.future_color
+        if context.space_data.overlay.show_overlays == False:
+            return
+        
+        ac = context.scene.anmx_data
+        playing = context.screen.is_animation_playing
+        quality = governor_level(ac, playing)
         
+        start = time.perf_counter()
+        draw_ghosts(context.scene, quality)
+        elapsed = time.perf_counter() - start
+        
+        perf.add_draw(elapsed)
+        govern(ac, elapsed, playing)
 
 
-        override = False
-        
-        color = (0, 0, 0, 0)
+def governor_level(anmx, playing):
+    """ Quality level the ghosts are drawn with, full quality whenever the animation is not playing """
+    if not anmx.use_governor or not playing:
+        governor.update(level=0, average=None, draws=0)
+    return governor["level"]
+
+
+def govern(anmx, elapsed, playing):
+    """ Lowers the quality when drawing takes longer than the budget during playback """
+    if not anmx.use_governor or not playing:
+        return
+    
+    # An average over a few draws so a single slow draw doesn't lower the quality
+    average = governor["average"]
+    governor["average"] = elapsed if average is None else average + (elapsed - average) * governor_smoothing
+    governor["draws"] += 1
+    
+    if governor["draws"] < governor_settle or governor["average"] * 1000 <= anmx.draw_budget:
+        return
+    
+    # Coarser ghosts only help when there are simplified levels to draw
+    level = governor["level"] + 1
+    if level == 1 and len(lod_levels()) <= 1:
+        level = 2
+    governor.update(level=min(level, len(quality_levels) - 1), average=None, draws=0)
+
+
+def use_shader(shader, colors, models):
+    """ Binds the shader with the colours and model matrices of a group of ghosts, each ghost only picks its index """
+    shader.bind()
+    shader.uniform_vector_float(shader.uniform_from_name("colors"), colors, 4, len(colors))
+    shader.uniform_vector_float(shader.uniform_from_name("models"), models, 16, len(models))
+    return shader
+
+
+def draw_ghosts(scn, quality=0):
+    """ Draws the ghosts around the current frame into the bound framebuffer, quality is the governor level to draw with """
+    ac = scn.anmx_data
+    f = scn.frame_current
+
+    count = ac.skin_count
+    
+    # The governor draws coarser ghosts, then only the nearest ones, then none at all
+    if quality >= 4:
+        return
+    reach = count
+    if quality == 2:
+        reach = max(1, count // 2)
+    elif quality == 3:
+        reach = 1
+    
+    colors = get_colors(ac)
+    levels = len(lod_levels())
+    coarser = 1 if quality >= 1 else 0
+    ghosts = []
+    
+    # Only the frames within the skin limits are visited
+    for frame in visible_frames(f, reach):
+        key = str(frame)
         
-        threshold = ac.skin_count
+        # Getting the color from the table, None when it is the current frame or past / future is disabled
+        if len(extern_data) == 0:
+            color = colors["plain"][frame - f + count]
+        elif key in extern_data:
+            color = colors["key"][frame - f + count]
+        else:
+            color = colors["inbetween"][frame - f + count]
         
-        if context.space_data.overlay.show_overlays == False:
-            return
+        if color is not None:
+            level = min(lod.level_of(abs(frame - f), count, levels) + coarser, max(levels - 1, 0))
+            ghosts.append((ghost_batch(key, level), color, models.get(key, identity), key, level))
+    
+    if not ghosts:
+        draw_data.pop("windows", None)
+        return
+    
+    # The GPU state is set once for all of the ghosts
+    if not ac.use_flat:
+        bgl.glEnable(bgl.GL_BLEND)
+        bgl.glEnable(bgl.GL_CULL_FACE)
+    if not ac.use_xray:
+        bgl.glEnable(bgl.GL_DEPTH_TEST)
+    bgl.glPointSize(ac.point_size)
+    
+    windows = dict([])
+    for start in range(0, len(ghosts), max_ghosts):
+        group = ghosts[start:start + max_ghosts]
+        group_colors = np.array([ghost[1] for ghost in group], 'f')
+        group_models = np.array([ghost[2].T for ghost in group], 'f')
         
-        for key in batches:
-            f_dif = abs(f-int(key))
-
-            # Getting the color if the batch is in the past
+        # Ghosts sharing one batch, like the ones of the transform fast path, are drawn as instances in one call
+        if hasattr(group[0][0], "draw_instanced") and all(g[0] is group[0][0] for g in group):
+            shader = use_shader(get_shader(), group_colors, group_models)
+            shader.uniform_int("ghost", 0)
+            group[0][0].draw_instanced(shader, instance_start=0, instance_count=len(group))
+            continue
         
-            if len(extern_data) == 0:
-                if f > int(key):
-                    if ac.past_enabled:
-                        color = (pc[0], pc[1], pc[2], ac.past_opacity_start-((ac.past_opacity_start-ac.past_opacity_end)/ac.skin_count) * f_dif)
-                    else:
-                        override = True
-                # Getting the color if the batch is in the future
-                else:
-                    if ac.future_enabled:
-                        color = (fc[0], fc[1], fc[2], ac.future_opacity_start-((ac.future_opacity_start-ac.future_opacity_end)/ac.skin_count) * f_dif)
-                    else:
-                        override = True
-            else:
-                if key in extern_data:
-                    color = (fc[0], fc[1], fc[2], ac.future_opacity_start-((ac.future_opacity_start-ac.future_opacity_end)/ac.skin_count) * f_dif)
-                else:
-                    color = (pc[0], pc[1], pc[2], ac.past_opacity_start-((ac.past_opacity_start-ac.past_opacity_end)/ac.skin_count) * f_dif)
-            
-            # Only draws if the frame is not the current one, it is within the skin limits, and there has not been an override
-            if f != int(key) and f_dif <= ac.skin_count and not override:
-                shader.bind()
-                shader.uniform_float("color", color)
-                
-                # Theres gotta be a better way to do this. Seems super inefficient
-                if not ac.use_flat:
-                    bgl.glEnable(bgl.GL_BLEND)
-                    bgl.glEnable(bgl.GL_CULL_FACE)
-                if not ac.use_xray:
-                    bgl.glEnable(bgl.GL_DEPTH_TEST)
-                
-                batches[key].draw(shader)
-                
-                bgl.glDisable(bgl.GL_BLEND)
-                bgl.glDisable(bgl.GL_CULL_FACE)
-                bgl.glDisable(bgl.GL_DEPTH_TEST)
-            
-            override = False
\ No newline at end of file
+        # Ghosts with the shared topology are drawn with one window batch per level, the others one by one
+        merged, single = window_batches(group, windows)
+        for shader, draws in [(get_shader(window=True), merged), (get_shader(), single)]:
+            if not draws:
+                continue
+            use_shader(shader, group_colors, group_models)
+            for batch, ghost in draws:
+                shader.uniform_int("ghost", ghost)
+                batch.draw(shader)
+    
+    # Window batches of the ghosts that were not drawn this time are released
+    draw_data["windows"] = windows
+    
+    bgl.glDisable(bgl.GL_BLEND)
+    bgl.glDisable(bgl.GL_CULL_FACE)
+    bgl.glDisable(bgl.GL_DEPTH_TEST)
+    bgl.glPointSize(1.0)
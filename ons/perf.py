@@ -0,0 +1,71 @@
+###########################
+## Onion Skinning Perf
+###########################
+
+# Times every phase of the bake and the drawing of the ghosts, so a slow bake can be traced to the step
+# that takes the time. Timings add up until they are reset by the next bake. Kept free of bpy.
+
+import json
+import time
+from contextlib import contextmanager
+
+# name: [seconds, calls]
+phases = dict([])
+
+# Time spent in the draw callback, on the CPU, the GPU works on the draw calls after it returns
+draws = {"count": 0, "total": 0.0, "max": 0.0}
+
+# Phases in the order they run in a bake, the report lists them in this order
+order = ["frame_set", "to_mesh", "transform", "triangles", "foreach_get", "skin", "matrices", "pack",
+         "vertex_buffer", "batch", "lod", "cache_load", "cache_save"]
+
+
+@contextmanager
+def timed(name):
+    """ Adds the time spent in the block to the phase """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add(name, time.perf_counter() - start)
+
+
+def add(name, seconds):
+    entry = phases.setdefault(name, [0.0, 0])
+    entry[0] += seconds
+    entry[1] += 1
+
+
+def add_draw(seconds):
+    draws["count"] += 1
+    draws["total"] += seconds
+    draws["max"] = max(draws["max"], seconds)
+
+
+def reset(draw=True):
+    """ Clears the phase timings, and the draw timings unless draw is False """
+    phases.clear()
+    if draw:
+        draws.update(count=0, total=0.0, max=0.0)
+
+
+def report(extra=None):
+    """ Returns the timings as a dict, seconds per phase and the calls made, extra entries are added as they are """
+    names = [n for n in order if n in phases] + sorted(n for n in phases if n not in order)
+    result = {
+        "phases": dict((n, {"seconds": phases[n][0], "calls": phases[n][1]}) for n in names),
+        "draw": {
+            "count": draws["count"],
+            "average": draws["total"] / draws["count"] if draws["count"] else 0.0,
+            "max": draws["max"],
+            },
+        }
+    if extra:
+        result.update(extra)
+    return result
+
+
+def dump(path, extra=None):
+    """ Writes the report as JSON """
+    with open(path, "w") as f:
+        json.dump(report(extra), f, indent=1)
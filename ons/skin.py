@@ -0,0 +1,70 @@
+###########################
+## Onion Skinning Skinning
+###########################
+
+# Linear blend skinning of rest pose vertices with NumPy, used to bake meshes that are only deformed by an
+# armature without evaluating their modifier stack. Kept free of bpy, the add-on captures the data.
+
+import numpy as np
+
+
+class Skin:
+    """ Everything of a mesh that stays the same while its armature is posed """
+
+    def __init__(self, modifier, names, rest, bones, weights, indices, rest_inv):
+        self.modifier = modifier    # Name of the armature modifier
+        self.names = names          # Deforming bones, the order used by bones
+        self.rest = rest            # (N, 3) rest vertices in object space
+        self.bones = bones          # (N, K) bone of every influence
+        self.weights = weights      # (N, K) normalized weight of every influence
+        self.indices = indices      # (T, 3) triangles
+        self.rest_inv = rest_inv    # (B, 4, 4) inverted rest matrices of the bones
+
+        # Vertices without deforming weights are not moved by the armature
+        self.static = weights.sum(axis=1) == 0
+
+
+def make_skin(modifier, names, rest, influences, indices, rest_inv):
+    """ Builds a Skin from per vertex lists of (bone, weight) influences """
+    vertex = [v for v, influence in enumerate(influences) for _ in influence]
+    pairs = np.array([pair for influence in influences for pair in influence], 'f').reshape(-1, 2)
+    return skin_arrays(modifier, names, rest, vertex, pairs[:, 0].astype('i'), pairs[:, 1], indices, rest_inv)
+
+
+def skin_arrays(modifier, names, rest, vertex, bone, weight, indices, rest_inv):
+    """ Builds a Skin from flat arrays of the vertex, bone and weight of every influence, ordered by vertex """
+    vertex = np.asarray(vertex, 'i')
+    counts = np.bincount(vertex, minlength=len(rest))
+    count = max(1, counts.max() if len(counts) else 0)
+
+    # Every influence goes to the next free column of its vertex
+    slot = np.arange(len(vertex)) - (np.cumsum(counts) - counts)[vertex]
+    bones = np.zeros((len(rest), count), 'i')
+    weights = np.zeros((len(rest), count), 'f')
+    bones[vertex, slot] = bone
+    weights[vertex, slot] = weight
+
+    # Weights are normalized like the armature modifier does
+    total = weights.sum(axis=1)
+    weights[total > 0] /= total[total > 0, None]
+
+    return Skin(modifier, names, rest, bones, weights, indices, rest_inv)
+
+
+def transform(vertices, matrix):
+    """ Applies a 4x4 matrix to (N, 3) vertices """
+    return vertices @ matrix[:3, :3].T + matrix[:3, 3]
+
+
+def deform(skin, pose, premat, postmat):
+    """ Skins the rest vertices by the (B, 4, 4) pose matrices, premat takes them to armature space and postmat back out """
+    vertices = transform(skin.rest, premat)
+    matrices = np.matmul(pose, skin.rest_inv)
+
+    out = np.zeros_like(vertices)
+    for k in range(skin.bones.shape[1]):
+        m = matrices[skin.bones[:, k]]
+        out += skin.weights[:, k, None] * (np.einsum('nij,nj->ni', m[:, :3, :3], vertices) + m[:, :3, 3])
+
+    out[skin.static] = vertices[skin.static]
+    return transform(out, postmat).astype('f')
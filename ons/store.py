@@ -0,0 +1,76 @@
+##############################
+## Onion Skinning Frame Store
+##############################
+
+# Compact storage for baked vertex positions. Kept free of bpy so it can be used outside of Blender.
+
+import numpy as np
+
+precisions = [
+    ("FULL", "Full", "Stores every frame as 32-bit floats, no loss in precision", 1),
+    ("HALF", "Half", "Stores the offset to the first frame as 16-bit floats, halves memory with small loss for far moving meshes", 2),
+    ("QUANT", "Quantized", "Stores the offset to the first frame as 16-bit integers within the bounds of each frame, halves memory with an even error over the mesh", 3),
+    ]
+
+# Number of steps a 16-bit integer can hold
+quant_steps = 65535
+
+
+class Packed:
+    """ Vertex positions stored as a 16-bit delta against a reference frame """
+    __slots__ = ("data", "low", "scale")
+
+    def __init__(self, data, low=None, scale=None):
+        self.data = data
+        self.low = low
+        self.scale = scale
+
+    @property
+    def nbytes(self):
+        extra = 0 if self.low is None else self.low.nbytes + self.scale.nbytes
+        return self.data.nbytes + extra
+
+    def __len__(self):
+        return len(self.data)
+
+
+def pack(vertices, reference, precision):
+    """ Packs vertices against the reference frame, vertices that can't be packed are returned as they are """
+    if precision == "FULL" or reference is None or vertices is reference or vertices.shape != reference.shape:
+        return vertices
+
+    delta = vertices - reference
+
+    if precision == "HALF":
+        return Packed(delta.astype(np.float16))
+
+    # Per frame bounds so the 16 bits are spread over what actually moved
+    low = delta.min(axis=0)
+    scale = (delta.max(axis=0) - low) / quant_steps
+    scale[scale == 0] = 1
+
+    data = np.round((delta - low) / scale) - (quant_steps + 1) // 2
+    return Packed(data.astype(np.int16), low.astype('f'), scale.astype('f'))
+
+
+def unpack(vertices, reference):
+    """ Returns the float32 positions of packed or plain vertices """
+    if not isinstance(vertices, Packed):
+        return vertices
+
+    if vertices.low is None:
+        delta = vertices.data.astype('f')
+    else:
+        delta = (vertices.data.astype('f') + (quant_steps + 1) // 2) * vertices.scale + vertices.low
+
+    return reference + delta
+
+
+def nbytes(vertices):
+    """ Bytes held by packed or plain vertices """
+    return vertices.nbytes
+
+
+def full_nbytes(vertices):
+    """ Bytes the vertices would take as plain float32 positions """
+    return len(vertices) * 3 * 4
@@ -0,0 +1,135 @@
+###########################
+## Onion Skinning Workers
+###########################
+
+# Splits a bake over several processes. Each worker bakes a slice of the frames and writes it to .npy files
+# in a shared folder, which are then memory mapped so the baked frames are never copied into the add-on.
+# Everything except worker_main is kept free of bpy so the orchestration can run with plain processes.
+
+import os
+import sys
+import json
+import multiprocessing
+
+import numpy as np
+
+
+# Frames every worker has to get at least, starting Blender and loading the file costs more than baking a few frames in place
+min_frames = 8
+
+
+def worker_count(frames, count):
+    """ Number of workers worth starting for a bake of that many frames, 0 when it is faster in place """
+    count = min(count, frames // min_frames)
+    return count if count > 1 else 0
+
+
+def split_frames(frames, count):
+    """ Splits frames into count contiguous slices, neighbouring frames evaluate fastest in the same process """
+    frames = list(frames)
+    count = max(1, min(count, len(frames)))
+    size, extra = divmod(len(frames), count)
+
+    slices = []
+    start = 0
+    for i in range(count):
+        end = start + size + (1 if i < extra else 0)
+        slices.append(frames[start:end])
+        start = end
+    return slices
+
+
+def slice_path(folder, index, name):
+    return os.path.join(folder, "slice_{}_{}".format(index, name))
+
+
+def write_slice(folder, index, frames, results):
+    """ Writes the [vertices, indices] of every frame of a slice as two contiguous arrays and a manifest """
+    vertices = [r[0] for r in results]
+    indices = [r[1] for r in results]
+
+    manifest = {
+        "frames": [int(f) for f in frames],
+        "vertex_counts": [len(v) for v in vertices],
+        "index_counts": [len(i) for i in indices],
+        }
+
+    np.save(slice_path(folder, index, "vertices.npy"), np.concatenate(vertices).astype('f'))
+    np.save(slice_path(folder, index, "indices.npy"), np.concatenate(indices).astype('i'))
+
+    # Manifest is written last, it marks the slice as complete
+    with open(slice_path(folder, index, "manifest.json"), "w") as f:
+        json.dump(manifest, f)
+
+
+def read_slice(folder, index):
+    """ Maps a written slice, returns a dict of frame: [vertices, indices] holding views into the mapped files """
+    with open(slice_path(folder, index, "manifest.json")) as f:
+        manifest = json.load(f)
+
+    vertices = np.load(slice_path(folder, index, "vertices.npy"), mmap_mode='r')
+    indices = np.load(slice_path(folder, index, "indices.npy"), mmap_mode='r')
+
+    results = dict([])
+    v_start = 0
+    i_start = 0
+    for frame, v_count, i_count in zip(manifest["frames"], manifest["vertex_counts"], manifest["index_counts"]):
+        results[frame] = [vertices[v_start:v_start + v_count], indices[i_start:i_start + i_count]]
+        v_start += v_count
+        i_start += i_count
+    return results
+
+
+def bake_parallel(frames, count, folder, launch):
+    """ Bakes frames over count workers started by launch(folder, index, frames), returns the mapped results """
+    slices = split_frames(frames, count)
+    workers = [launch(folder, i, part) for i, part in enumerate(slices)]
+
+    # Every worker has to finish, a missing slice would leave holes in the onion skins
+    failed = [i for i, worker in enumerate(workers) if worker.wait() != 0]
+    if failed:
+        raise RuntimeError("Onion bake workers {} failed".format(failed))
+
+    results = dict([])
+    for i in range(len(slices)):
+        results.update(read_slice(folder, i))
+    return results
+
+
+def blender_command(binary, blend, folder, index, frames, names, package, path):
+    """ Command line for a headless Blender worker baking frames of the named objects, path is where package is found """
+    expr = "import sys; sys.path.insert(0, {!r}); import {}.workers as w; w.worker_main()".format(path, package)
+    args = [folder, str(index), ",".join(str(int(f)) for f in frames)] + list(names)
+    return [binary, "-b", "--factory-startup", blend, "--python-expr", expr, "--"] + args
+
+
+class LocalWorker:
+    """ Runs a worker function in a plain process, a stand-in for the Blender worker that needs no GPU """
+
+    def __init__(self, target, folder, index, frames):
+        self.process = multiprocessing.Process(target=target, args=(folder, index, frames))
+        self.process.start()
+
+    def wait(self):
+        self.process.join()
+        return self.process.exitcode
+
+
+def worker_main():
+    """ Entry point of a headless Blender worker, bakes its slice with the same evaluation as the add-on """
+    import bpy
+    from .ops import read_objects
+
+    argv = sys.argv[sys.argv.index("--") + 1:]
+    folder = argv[0]
+    index = int(argv[1])
+    frames = [int(f) for f in argv[2].split(",")]
+    objs = [bpy.data.objects[name] for name in argv[3:]]
+
+    scn = bpy.context.scene
+    results = []
+    for f in frames:
+        scn.frame_set(f)
+        results.append(read_objects(objs))
+
+    write_slice(folder, index, frames, results)
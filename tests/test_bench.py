@@ -0,0 +1,43 @@
+import pytest
+
+from ons import bench
+from tools import bench_plain
+from tools import standin
+
+
+@pytest.fixture(scope="module")
+def ops():
+    bench_plain.install_standin()
+    from ons import ops
+    return ops
+
+
+@pytest.mark.parametrize("mode, expected", [("PF", list(range(1, 22))), ("PFS", list(range(1, 22, bench.skin_step))), ("DC", [1, 11, 21])])
+def test_pipeline_bakes_the_frames_of_the_mode_and_draws_them(ops, mode, expected):
+    standin.reset_drawn()
+    rec = bench.Recorder()
+    baked = bench.run_pipeline(rec, 400, mode, 25)
+
+    assert sorted(baked) == expected
+    assert set(rec.phases) == {"bake", "batches", "draw"}
+    assert standin.drawn["calls"] > 0
+
+    # The wave and the keyed location both move the mesh, every frame is its own pose
+    first, last = baked[expected[0]][0], baked[expected[-1]][0]
+    assert abs(float(last[:, 0].mean() - first[:, 0].mean()) - (expected[-1] - expected[0]) * 0.01) < 1e-4
+    assert not ops.frame_data and not ops.batches
+
+
+def test_plain_run_times_every_stage(ops, tmp_path):
+    rec = bench.Recorder()
+    bench_plain.run_plain(rec, 400, "PF", 25, str(tmp_path))
+    assert set(rec.phases) == {"bake", "batches", "draw", "pack", "unpack", "lod", "skin", "cache", "workers"}
+
+
+def test_compare_reports_slower_phases_and_memory():
+    baseline = {"case": {"phases": {"bake": 0.1, "draw": 0.001}, "peak": 100}}
+    results = {"case": {"phases": {"bake": 0.2, "draw": 0.004}, "peak": 200}, "new": {"phases": {}, "peak": 1}}
+    regressions = bench.compare(results, baseline, 0.5)
+    assert len(regressions) == 2
+    assert regressions[0].startswith("case bake")
+    assert regressions[1].startswith("case peak")
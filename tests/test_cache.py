@@ -0,0 +1,57 @@
+import os
+
+import numpy as np
+
+from ons import cache
+
+
+def baked(count=3):
+    indices = np.array([[0, 1, 2], [1, 2, 3]], 'i')
+    return dict((f, [np.full((4, 3), f, 'f'), indices]) for f in range(1, count + 1))
+
+
+def test_make_key_depends_on_every_part():
+    a = np.arange(6, dtype='f')
+    assert cache.make_key(["PF", 1, a]) == cache.make_key(["PF", 1, a.copy()])
+    assert cache.make_key(["PF", 1, a]) != cache.make_key(["PF", 2, a])
+    assert cache.make_key(["PF", 1, a]) != cache.make_key(["PF", 1, a.reshape(2, 3)])
+
+
+def test_saved_frames_load_as_mapped_views(tmp_path):
+    folder = str(tmp_path)
+    frames = baked()
+    key = cache.make_key(["Body"])
+    cache.save(folder, "Body_PF", key, frames)
+
+    loaded = cache.load(folder, "Body_PF", key)
+    assert sorted(loaded) == sorted(frames)
+    for f, (vertices, indices) in frames.items():
+        np.testing.assert_array_equal(loaded[f][0], vertices)
+        np.testing.assert_array_equal(loaded[f][1], indices)
+
+    # The shared index array is stored once
+    assert len(np.load(os.path.join(cache.entry_path(folder, "Body_PF", key), "indices.npy"))) == 2
+
+
+def test_other_key_misses_and_new_entry_prunes_old_one(tmp_path):
+    folder = str(tmp_path)
+    old = cache.make_key(["old"])
+    new = cache.make_key(["new"])
+    cache.save(folder, "Body_PF", old, baked())
+    cache.save(folder, "Body_DC", old, baked())
+
+    assert cache.load(folder, "Body_PF", new) is None
+
+    cache.save(folder, "Body_PF", new, baked(2))
+    assert not cache.exists(folder, "Body_PF", old)
+    assert cache.exists(folder, "Body_PF", new)
+    assert cache.exists(folder, "Body_DC", old)
+    assert sorted(cache.load(folder, "Body_PF", new)) == [1, 2]
+
+
+def test_incomplete_entry_is_not_loaded(tmp_path):
+    folder = str(tmp_path)
+    key = cache.make_key(["Body"])
+    cache.save(folder, "Body_PF", key, baked())
+    os.remove(os.path.join(cache.entry_path(folder, "Body_PF", key), "manifest.json"))
+    assert cache.load(folder, "Body_PF", key) is None
@@ -0,0 +1,53 @@
+import numpy as np
+
+from ons import lod
+
+
+def make_grid(count):
+    """ Flat grid of about count vertices and its triangles """
+    side = max(2, int(round(count ** 0.5)))
+    u, v = np.meshgrid(np.linspace(-1, 1, side, dtype='f'), np.linspace(-1, 1, side, dtype='f'))
+    vertices = np.stack([u.ravel(), v.ravel(), np.zeros(side * side, 'f')], axis=1)
+
+    quads = (np.arange(side - 1)[None, :] + np.arange(side - 1)[:, None] * side).ravel()
+    indices = np.concatenate([
+        np.stack([quads, quads + 1, quads + side], axis=1),
+        np.stack([quads + 1, quads + side + 1, quads + side], axis=1),
+        ]).astype('i')
+    return vertices, indices
+
+
+def test_mesh_within_budget_is_not_simplified():
+    vertices, indices = make_grid(100)
+    assert lod.build(vertices, indices, len(indices)) is None
+    assert lod.build_levels(vertices, indices, len(indices) * lod.level_falloff ** lod.level_count) == []
+
+
+def test_levels_stay_within_their_budgets():
+    vertices, indices = make_grid(10000)
+    budget = 2000
+    levels = lod.build_levels(vertices, indices, budget)
+
+    assert len(levels) == lod.level_count
+    for i, simple in enumerate(levels):
+        assert len(simple.indices) <= max(1, budget // lod.level_falloff ** i)
+        assert simple.indices.max() < len(simple)
+        assert len(simple.clusters) == len(vertices)
+
+
+def test_apply_averages_the_vertices_of_each_cluster():
+    vertices, indices = make_grid(2500)
+    simple = lod.build(vertices, indices, 500)
+
+    moved = vertices + [1, 2, 3]
+    out = lod.apply(simple, moved)
+    assert out.shape == (len(simple), 3)
+    for c in [0, len(simple) // 2, len(simple) - 1]:
+        np.testing.assert_allclose(out[c], moved[simple.clusters == c].mean(axis=0), atol=1e-5)
+
+
+def test_level_of_gives_the_nearest_ghosts_the_finest_level():
+    assert lod.level_of(1, 6, 3) == 0
+    assert lod.level_of(6, 6, 3) == 2
+    assert [lod.level_of(d, 6, 3) for d in range(1, 7)] == sorted(lod.level_of(d, 6, 3) for d in range(1, 7))
+    assert lod.level_of(4, 6, 1) == 0
@@ -0,0 +1,243 @@
+import numpy as np
+import pytest
+
+from ons import bench
+from tools import bench_plain
+from tools import standin
+
+
+@pytest.fixture(scope="module")
+def ops():
+    bench_plain.install_standin()
+    from ons import ops
+    return ops
+
+
+@pytest.fixture
+def held(ops):
+    """ Onion object keyed to stay in place over 60 frames, so every frame has the same pose """
+    obj = bench.make_blender_object(400, 1)
+    obj.modifiers.clear()
+    obj.keyframe_insert("location", index=0, frame=60)
+
+    anmx = standin.context.scene.anmx_data
+    anmx.onion_object = obj.name
+    anmx.onion_mode = "PF"
+    anmx.fast_transform = False
+    ops.clear_data()
+    yield obj
+    ops.clear_data()
+    anmx.onion_object = ""
+    bench.remove_blender_object(obj)
+
+
+def test_held_frames_share_one_array_from_a_single_chunk(ops, held):
+    ops.bake_frames()
+
+    stored = set(id(arg[0]) for arg in ops.frame_data.values())
+    assert len(ops.frame_data) == 60
+    assert len(stored) == 1
+
+    # The pool only grew by the one distinct pose, not by the frame count
+    vertices = ops.frame_data["1"][0]
+    assert vertices.base is not None and len(vertices.base) <= ops.pool_chunk
+
+
+def test_moving_frames_get_their_own_slots(ops, held):
+    held.modifiers.new("Wave", 'WAVE')
+    ops.bake_frames()
+
+    arrays = [ops.frame_data[str(f)][0] for f in range(1, 61)]
+    assert len(set(id(a) for a in arrays)) == 60
+    assert len(set(id(a.base) for a in arrays)) == -(-60 // ops.pool_chunk)
+    assert not np.array_equal(arrays[0], arrays[1])
+
+
+def test_read_frame_works_without_the_addon_registered(ops, held):
+    scene = standin.context.scene
+    anmx = scene.anmx_data
+    del scene.anmx_data
+    try:
+        vertices, indices = ops.read_objects([held])
+    finally:
+        scene.anmx_data = anmx
+
+    assert vertices.shape == held.data.co.shape
+    assert indices.shape == held.data.triangles.shape
+
+
+def test_point_ghosts_keep_the_same_sample_of_every_frame(ops, held):
+    anmx = standin.context.scene.anmx_data
+    anmx.ghost_style = "POINTS"
+    anmx.point_count = 50
+    try:
+        ops.bake_frames()
+        ops.make_batches()
+    finally:
+        anmx.ghost_style = "MESH"
+
+    sample = ops.frame_data["1"][1]
+    assert sample.ndim == 1 and len(sample) == 50
+    assert all(arg[1] is sample for arg in ops.frame_data.values())
+    np.testing.assert_array_equal(ops.frame_data["1"][0], held.data.co[sample] + held.matrix_world[:3, 3])
+    assert ops.batches["1"].type == 'POINTS'
+
+
+def test_modifier_targets_are_read_by_the_digest_and_the_key_snapshot(ops, held):
+    target = standin.data.objects.new("Lattice")
+    held.modifiers.new("Lattice", 'LATTICE').object = target
+    try:
+        digest = ops.input_digest(held)
+        target.location.y = 1.0
+        assert ops.input_digest(held) != digest
+
+        # Once keyed the channel is part of the key snapshot instead, moving it on a frame change doesn't count as an edit
+        target.keyframe_insert("location", index=1, frame=10)
+        digest = ops.input_digest(held)
+        target.location.y = 2.0
+        assert ops.input_digest(held) == digest
+
+        assert target in ops.snapshot_objects(held)
+        assert target.name in ops.watched_ids(held)
+        assert (target.name, "location", 1) in ops.key_snapshot(ops.snapshot_objects(held))
+    finally:
+        standin.data.objects.remove(target)
+
+
+def test_auto_update_waits_for_posing_to_be_keyed(ops, held):
+    standin.context.scene.frame_set(30)
+    assert not ops.unkeyed_changes(held)
+
+    held.location.x += 1.0
+    assert ops.unkeyed_changes(held)
+
+    held.keyframe_insert("location", index=0, frame=30)
+    assert not ops.unkeyed_changes(held)
+
+
+def test_ghosts_drawn_again_are_merged_into_one_window_batch(ops, held, monkeypatch):
+    scn = standin.context.scene
+    held.modifiers.new("Wave", 'WAVE')
+    monkeypatch.setattr(scn.anmx_data, "skin_count", 3)
+    ops.draw_data.pop("colors", None)
+    ops.bake_frames()
+    ops.make_batches()
+    scn.frame_current = 30
+
+    standin.reset_drawn()
+    ops.draw_ghosts(scn)
+    assert standin.drawn["calls"] == 6
+    elements = standin.drawn["elements"]
+
+    # Drawn again without a frame change, the six ghosts share the topology and become one batch
+    standin.reset_drawn()
+    ops.draw_ghosts(scn)
+    assert standin.drawn["calls"] == 1
+    assert standin.drawn["elements"] == elements
+
+    (batch,) = [b for b in ops.draw_data["windows"].values() if b is not None]
+    np.testing.assert_array_equal(np.unique(batch.buf.attributes["slot"]), range(6))
+    np.testing.assert_array_equal(batch.buf.data[:len(held.data.co)], ops.frame_vertices(ops.frame_data["27"]))
+
+    # Another frame draws the ghosts one by one again
+    scn.frame_current = 31
+    standin.reset_drawn()
+    ops.draw_ghosts(scn)
+    assert standin.drawn["calls"] == 6
+
+
+def keys(*frames):
+    """ Key rows of a single F-curve as read_action makes them, the value is the frame """
+    rows = np.zeros((len(frames), 7), 'f')
+    rows[:, 0] = frames
+    rows[:, 1] = frames
+    return rows
+
+
+def test_dirty_range_reaches_to_the_neighbouring_keys(ops):
+    old = keys(1, 10, 20, 30)
+    new = old.copy()
+    new[2, 1] = 5.0
+    assert ops.curve_dirty_range(old, new) == (10, 30)
+
+    # Moving the first key changes the extrapolation before it
+    new = keys(5, 10, 20, 30)
+    assert ops.curve_dirty_range(old, new) == (-np.inf, 10)
+
+    old_snapshot = {("Cube", "location", 0): (old, False), ("Cube", "location", 1): (old, False)}
+    new_snapshot = {("Cube", "location", 0): (new, False), ("Cube", "location", 1): (old, False)}
+    assert ops.dirty_ranges(old_snapshot, new_snapshot) == [(-np.inf, 10)]
+    assert ops.dirty_ranges(old_snapshot, old_snapshot) == []
+
+    # Curve modifiers and added curves can change any frame
+    new_snapshot[("Cube", "location", 1)] = (new, True)
+    assert ops.dirty_ranges(old_snapshot, new_snapshot) == [(-np.inf, np.inf)]
+    assert ops.dirty_ranges(old_snapshot, {("Cube", "location", 0): (old, False)}) == [(-np.inf, np.inf)]
+
+
+def test_windowed_bake_fills_the_window_and_drops_far_frames(ops, held, monkeypatch):
+    scn = standin.context.scene
+    monkeypatch.setattr(scn.anmx_data, "bake_window", True)
+    monkeypatch.setattr(scn.anmx_data, "skin_count", 3)
+    scn.frame_current = 30
+    ops.bake_frames()
+    ops.make_batches()
+    assert sorted(map(int, ops.frame_data)) == list(range(27, 34))
+
+    scn.frame_current = 35
+    ops.update_window(scn)
+    assert sorted(map(int, ops.frame_data)) == list(range(27, 39))
+    assert set(ops.batches) == set(ops.frame_data)
+
+    # Frames further than window_margin radii away are dropped along with their batches
+    scn.frame_current = 50
+    ops.update_window(scn)
+    assert sorted(map(int, ops.frame_data)) == list(range(47, 54))
+    assert set(ops.batches) == set(ops.frame_data)
+
+
+def test_color_table_fades_ghosts_and_hides_disabled_sides(ops, monkeypatch):
+    anmx = standin.context.scene.anmx_data
+    monkeypatch.setattr(anmx, "skin_count", 2)
+    monkeypatch.setattr(anmx, "past_enabled", False)
+    table = ops.color_table(anmx)
+
+    assert all(len(colors) == 5 for colors in table.values())
+    assert table["plain"][:3] == [None, None, None]
+    assert table["inbetween"][0] is not None and table["inbetween"][2] is None
+
+    # Opacity goes from the start value next to the current frame to the end value at skin_count
+    assert table["plain"][3][3] == pytest.approx(anmx.future_opacity_start - (anmx.future_opacity_start - anmx.future_opacity_end) / 2)
+    assert table["plain"][4][3] == pytest.approx(anmx.future_opacity_end)
+
+
+def test_visible_frames_are_the_batches_inside_the_count(ops, held):
+    ops.bake_frames()
+    ops.make_batches()
+    assert ops.visible_frames(30, 2) == [28, 29, 30, 31, 32]
+    assert ops.visible_frames(1, 2) == [1, 2, 3]
+
+
+def stash_entry(folder=None):
+    """ Stashed bake holding 100 bytes in memory and 50 bytes on the GPU """
+    state = dict((name, {"1": object()}) for name in ["batches", "models", "lod_batches"])
+    state["topology"] = {"ibo": object(), "indices": object()}
+    return {"state": state, "folders": [folder] if folder else [], "bytes": [100, 50]}
+
+
+def test_stash_drops_batches_then_bakes_least_recently_used_first(ops, tmp_path):
+    folder = tmp_path / "worker"
+    folder.mkdir()
+    ops.stash.update((name, stash_entry(str(folder) if name == "a" else None)) for name in "abc")
+    try:
+        # GPU memory goes first, from the oldest bake on until the stash fits
+        ops.fit_stash(360)
+        assert list(ops.stash) == ["a", "b", "c"]
+        assert [bool(ops.stash[name]["state"]["batches"]) for name in "abc"] == [False, False, True]
+        assert "ibo" not in ops.stash["a"]["state"]["topology"] and "indices" in ops.stash["a"]["state"]["topology"]
+
+        ops.fit_stash(150)
+        assert list(ops.stash) == ["c"]
+        assert not folder.exists()
+    finally:
+        ops.stash.clear()
@@ -0,0 +1,53 @@
+import numpy as np
+
+from ons import skin
+
+
+def bones(angle):
+    """ A still bone and a bone turned by angle around z """
+    second = np.identity(4, 'f')
+    second[:2, :2] = [[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]]
+    return np.stack([np.identity(4, 'f'), second])
+
+
+def make(influences):
+    rest = np.array([[1, 0, 0], [0, 1, 0], [2, 2, 0]], 'f')
+    return skin.make_skin("Armature", ["a", "b"], rest, influences, np.array([[0, 1, 2]], 'i'), np.stack([np.identity(4, 'f')] * 2))
+
+
+def test_weights_are_normalized_and_unweighted_vertices_stay():
+    data = make([[(0, 2.0), (1, 2.0)], [(1, 0.5)], []])
+    np.testing.assert_allclose(data.weights[0], [0.5, 0.5])
+    np.testing.assert_allclose(data.weights[1], [1.0, 0.0])
+    assert data.static.tolist() == [False, False, True]
+
+
+def test_deform_blends_the_bone_matrices():
+    data = make([[(0, 1.0), (1, 1.0)], [(1, 1.0)], []])
+    identity = np.identity(4, 'f')
+    out = skin.deform(data, bones(np.pi / 2), identity, identity)
+
+    # Half way between the still and the turned position, fully turned, not moved
+    np.testing.assert_allclose(out[0], [0.5, 0.5, 0], atol=1e-6)
+    np.testing.assert_allclose(out[1], [-1, 0, 0], atol=1e-6)
+    np.testing.assert_allclose(out[2], [2, 2, 0], atol=1e-6)
+
+
+def test_deform_applies_premat_and_postmat():
+    data = make([[(0, 1.0)], [(0, 1.0)], [(0, 1.0)]])
+    premat = np.identity(4, 'f')
+    premat[:3, 3] = [1, 0, 0]
+    postmat = np.identity(4, 'f')
+    postmat[:3, 3] = [0, 0, 3]
+    out = skin.deform(data, bones(0), premat, postmat)
+    np.testing.assert_allclose(out, data.rest + [1, 0, 3], atol=1e-6)
+
+
+def test_flat_arrays_give_the_same_skin_as_influence_lists():
+    influences = [[(0, 2.0), (1, 2.0)], [(1, 0.5)], []]
+    data = make(influences)
+    flat = skin.skin_arrays("Armature", ["a", "b"], data.rest, [0, 0, 1], [0, 1, 1], [2.0, 2.0, 0.5], data.indices, data.rest_inv)
+
+    np.testing.assert_array_equal(flat.bones, data.bones)
+    np.testing.assert_allclose(flat.weights, data.weights)
+    assert flat.static.tolist() == data.static.tolist()
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from ons import store
+
+
+def frames():
+    rng = np.random.RandomState(1)
+    reference = rng.uniform(-1, 1, (500, 3)).astype('f')
+    moved = reference + rng.uniform(-0.2, 0.2, reference.shape).astype('f') + [5, 0, 0]
+    return reference, moved.astype('f')
+
+
+def test_full_precision_is_stored_as_it_is():
+    reference, moved = frames()
+    assert store.pack(moved, reference, "FULL") is moved
+    assert store.unpack(moved, reference) is moved
+
+
+@pytest.mark.parametrize("precision, tolerance", [("HALF", 1e-2), ("QUANT", 1e-4)])
+def test_packed_frames_round_trip_within_tolerance(precision, tolerance):
+    reference, moved = frames()
+    packed = store.pack(moved, reference, precision)
+
+    assert isinstance(packed, store.Packed)
+    assert len(packed) == len(moved)
+    assert store.nbytes(packed) < store.full_nbytes(moved)
+    np.testing.assert_allclose(store.unpack(packed, reference), moved, atol=tolerance)
+
+
+def test_frames_of_another_shape_are_not_packed():
+    reference, moved = frames()
+    assert not isinstance(store.pack(moved[:10], reference, "QUANT"), store.Packed)
+    assert store.pack(reference, reference, "QUANT") is reference
+
+
+def test_quantized_frame_without_motion_on_an_axis():
+    reference, moved = frames()
+    moved[:, 1] = reference[:, 1]
+    packed = store.pack(moved, reference, "QUANT")
+    np.testing.assert_allclose(store.unpack(packed, reference), moved, atol=1e-4)
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from ons import workers
+
+
+def frame_result(frame):
+    """ Vertices that tell the frame they were baked for, with one triangle """
+    vertices = np.full((4, 3), frame, 'f')
+    indices = np.array([[0, 1, 2]], 'i')
+    return [vertices, indices]
+
+
+def bake_slice(folder, index, frames):
+    workers.write_slice(folder, index, frames, [frame_result(f) for f in frames])
+
+
+def fail_slice(folder, index, frames):
+    raise SystemExit(1)
+
+
+def test_split_frames_keeps_order_and_covers_every_frame():
+    slices = workers.split_frames(range(10), 3)
+    assert slices == [[0, 1, 2, 3], [4, 5, 6], [7, 8, 9]]
+    assert workers.split_frames([1, 2], 5) == [[1], [2]]
+
+
+def test_worker_count_leaves_every_worker_enough_frames():
+    assert workers.worker_count(3, 4) == 0
+    assert workers.worker_count(workers.min_frames * 2 - 1, 4) == 0
+    assert workers.worker_count(workers.min_frames * 3, 4) == 3
+    assert workers.worker_count(workers.min_frames * 10, 4) == 4
+    assert workers.worker_count(1000, 1) == 0
+
+
+def test_bake_parallel_maps_every_frame(tmp_path):
+    frames = list(range(1, 12))
+
+    def launch(folder, index, part):
+        return workers.LocalWorker(bake_slice, folder, index, part)
+
+    results = workers.bake_parallel(frames, 3, str(tmp_path), launch)
+
+    assert sorted(results) == frames
+    for f in frames:
+        vertices, indices = results[f]
+        assert isinstance(vertices, np.memmap)
+        np.testing.assert_array_equal(vertices, frame_result(f)[0])
+        np.testing.assert_array_equal(indices, frame_result(f)[1])
+
+
+def test_bake_parallel_raises_when_a_worker_fails(tmp_path):
+    def launch(folder, index, part):
+        return workers.LocalWorker(fail_slice if index == 1 else bake_slice, folder, index, part)
+
+    with pytest.raises(RuntimeError, match=r"\[1\]"):
+        workers.bake_parallel(list(range(6)), 2, str(tmp_path), launch)
+
+
+def test_blender_command_passes_the_slice_after_separator():
+    command = workers.blender_command("blender", "a.blend", "/tmp/x", 2, [3, 4], ["Body", "Prop"], "animextras.ons", "/addons")
+    assert command[:5] == ["blender", "-b", "--factory-startup", "a.blend", "--python-expr"]
+    assert command[command.index("--") + 1:] == ["/tmp/x", "2", "3,4", "Body", "Prop"]
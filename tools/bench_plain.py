@@ -0,0 +1,71 @@
+###########################
+## Plain Python Benchmark
+###########################
+
+# Runs the cases of ons/bench.py with plain Python on the stand-ins of tools/standin.py, so the pipeline can be
+# timed without Blender. Evaluation is a NumPy deformation of the same size and drawing only counts what would be
+# drawn, the stages of the NumPy modules the pipeline doesn't reach with the default settings are timed too.
+# Not part of the add-on, run from the repository root:
+#     python -m tools.bench_plain --save bench.json
+#     python -m tools.bench_plain --baseline bench.json
+
+import numpy as np
+
+from ons import bench
+from ons import store
+from ons import cache
+from ons import lod
+from ons import skin
+from ons import workers
+from tools import standin
+
+
+def run_plain(rec, size, mode, frames_total, folder):
+    """ Runs the pipeline on the stand-ins, then the stages of the NumPy modules it doesn't reach with the default settings """
+    baked = bench.run_pipeline(rec, size, mode, frames_total)
+    frames = sorted(baked)
+    read = [baked[f][0] for f in frames]
+    indices = baked[frames[0]][1]
+    base = read[0]
+
+    with rec.phase("pack"):
+        packed = [store.pack(v, read[0], "QUANT") for v in read]
+
+    with rec.phase("unpack"):
+        unpacked = [store.unpack(v, read[0]) for v in packed]
+
+    with rec.phase("lod"):
+        levels = lod.build_levels(read[0], indices, max(100, len(indices) // 8))
+        for vertices in unpacked:
+            lod.apply(levels[0], vertices)
+
+    with rec.phase("skin"):
+        influences, rest_inv = bench.make_bones(base)
+        data = skin.make_skin("Armature", ["a", "b"], base, influences, indices, rest_inv)
+        for f in frames:
+            skin.deform(data, bench.bone_pose(f), np.identity(4, 'f'), np.identity(4, 'f'))
+
+    with rec.phase("cache"):
+        key = cache.make_key([size, mode])
+        cache.save(folder, "bench", key, baked)
+        loaded = cache.load(folder, "bench", key)
+        sum(float(v[0][0, 0]) for v in loaded.values())
+        del loaded
+
+    with rec.phase("workers"):
+        workers.write_slice(folder, 0, frames, [baked[f] for f in frames])
+        sliced = workers.read_slice(folder, 0)
+        sum(float(v[0][0, 0]) for v in sliced.values())
+        del sliced
+
+
+def install_standin():
+    """ Puts the stand-ins of bpy and gpu in place and registers the add-on's properties on their scene """
+    if not standin.install():
+        raise RuntimeError("Blender's modules are loaded, run ons/bench.py inside Blender instead")
+    from ons import ops
+    standin.register(ops)
+
+
+if __name__ == "__main__":
+    bench.main(prog="tools.bench_plain", setup=install_standin, case=run_plain)
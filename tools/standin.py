@@ -0,0 +1,488 @@
+###########################
+## Onion Skinning Stand-in
+###########################
+
+# Minimal stand-ins for bpy, gpu, bgl and mathutils, enough for the bake, batch and draw code of ops to run with
+# plain Python. Objects are moved by their location F-curves and deformed by a NumPy wave in place of the Wave
+# modifier, batches keep a copy of what would be uploaded and count what is drawn. install() has to run before
+# ops is imported, register() then gives the scene the add-on's properties. Used by tools/bench_plain.py and the
+# tests, it is not part of the add-on.
+
+import sys
+import types
+from contextlib import contextmanager
+
+import numpy as np
+
+# What the stand-in GPU has been asked to draw since the last reset
+drawn = {"calls": 0, "instances": 0, "elements": 0}
+
+
+# ################ #
+# mathutils        #
+# ################ #
+
+class Vector(list):
+    """ List of floats with x, y and z """
+
+    def _axis(index):
+        return property(lambda self: self[index], lambda self, value: self.__setitem__(index, value))
+
+    x = _axis(0)
+    y = _axis(1)
+    z = _axis(2)
+
+
+class Matrix(list):
+    """ Rows of a matrix, only Identity is used """
+
+    @classmethod
+    def Identity(cls, size):
+        return cls(np.identity(size).tolist())
+
+
+class Euler(Vector):
+    pass
+
+
+class Quaternion(Vector):
+    pass
+
+
+# ################ #
+# bpy.props        #
+# ################ #
+
+class Property:
+    """ What a bpy.props function was called with, PropertyGroup reads the default from it """
+
+    def __init__(self, kind, options):
+        self.kind = kind
+        self.options = options
+
+    def default(self):
+        if self.kind == "Collection":
+            return Collection(self.options.get("type"))
+        if self.kind == "Enum":
+            return self.options.get("default", self.options["items"][0][0])
+        if self.kind == "String":
+            return self.options.get("default", "")
+        if self.kind == "Pointer":
+            return None
+        return self.options.get("default", 0)
+
+
+def prop_function(kind):
+    return lambda **options: Property(kind, options)
+
+
+class PropertyGroup:
+    """ Instances start with the defaults of the annotated properties, setting them calls no update function """
+
+    def __init__(self):
+        for name, prop in getattr(type(self), "__annotations__", {}).items():
+            if isinstance(prop, Property):
+                setattr(self, name, prop.default())
+
+
+class Collection(list):
+    """ Collection property, add() appends a new item """
+
+    def __init__(self, kind=None):
+        super().__init__()
+        self.kind = kind
+
+    def add(self):
+        item = self.kind() if self.kind is not None else types.SimpleNamespace(name="")
+        self.append(item)
+        return item
+
+
+# ################ #
+# bpy.types        #
+# ################ #
+
+class Struct:
+    """ Base of the stand-in structs, bl_rna lists their plain attributes like RNA lists properties """
+
+    @property
+    def bl_rna(self):
+        kinds = {bool: 'BOOLEAN', int: 'INT', float: 'FLOAT', str: 'STRING'}
+        properties = []
+        for name, value in vars(self).items():
+            kind = 'POINTER' if isinstance(value, ID) else kinds.get(type(value))
+            if kind is not None:
+                properties.append(types.SimpleNamespace(identifier=name, type=kind))
+        return types.SimpleNamespace(properties=properties)
+
+
+class ID(Struct):
+    def __init__(self, name):
+        self.name = name
+
+    def as_pointer(self):
+        return id(self)
+
+
+class Operator:
+    pass
+
+
+class Panel:
+    pass
+
+
+class AddonPreferences:
+    pass
+
+
+class SpaceView3D:
+    pass
+
+
+class Points:
+    """ Vertices, triangles or keyframe points, foreach_get copies one attribute into a flat array """
+
+    def __init__(self, **attributes):
+        self.attributes = attributes
+
+    def __len__(self):
+        return len(next(iter(self.attributes.values())))
+
+    def foreach_get(self, name, out):
+        out[:] = np.ravel(self.attributes[name])
+
+    def __iter__(self):
+        for values in zip(*self.attributes.values()):
+            yield types.SimpleNamespace(**dict(zip(self.attributes, values)))
+
+
+class Mesh(ID):
+    def __init__(self, name, vertices=None, indices=None):
+        super().__init__(name)
+        self.shape_keys = None
+        self.animation_data = None
+        self.set_data(np.zeros((0, 3), 'f') if vertices is None else vertices, np.zeros((0, 3), 'i') if indices is None else indices)
+
+    def set_data(self, vertices, indices):
+        self.co = np.asarray(vertices, 'f').reshape(-1, 3)
+        self.triangles = np.asarray(indices, 'i').reshape(-1, 3)
+        self.vertices = Points(co=self.co, groups=[()] * len(self.co))
+        self.loop_triangles = Points(vertices=self.triangles)
+        self.loops = Points(vertex_index=self.triangles.ravel())
+
+    def from_pydata(self, vertices, edges, faces):
+        self.set_data(vertices, faces)
+
+    def calc_loop_triangles(self):
+        pass
+
+
+class Modifier(Struct):
+    def __init__(self, name, type):
+        self.name = name
+        self.type = type
+        self.show_viewport = True
+
+
+class Modifiers(list):
+    def new(self, name, type):
+        mod = Modifier(name, type)
+        self.append(mod)
+        return mod
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return next(m for m in self if m.name == key)
+        return super().__getitem__(key)
+
+
+class FCurve(Struct):
+    def __init__(self, data_path, array_index):
+        self.data_path = data_path
+        self.array_index = array_index
+        self.extrapolation = 'CONSTANT'
+        self.mute = False
+        self.driver = None
+        self.modifiers = []
+        self.keys = dict([])
+        self.keyframe_points = Points(co=np.zeros((0, 2), 'f'))
+
+    def insert(self, frame, value):
+        self.keys[float(frame)] = float(value)
+        co = np.array(sorted(self.keys.items()), 'f').reshape(-1, 2)
+        self.keyframe_points = Points(co=co, handle_left=co, handle_right=co, interpolation=np.ones(len(co), 'i'))
+
+    def evaluate(self, frame):
+        """ Linear interpolation, constant before the first and after the last key """
+        co = self.keyframe_points.attributes["co"]
+        return float(np.interp(frame, co[:, 0], co[:, 1]))
+
+
+class Action(ID):
+    def __init__(self, name):
+        super().__init__(name)
+        self.fcurves = []
+
+
+class AnimData(Struct):
+    def __init__(self):
+        self.action = None
+        self.drivers = []
+        self.nla_tracks = []
+
+
+class Object(ID):
+    def __init__(self, name, data=None):
+        super().__init__(name)
+        self.data = data
+        self.type = 'MESH' if isinstance(data, Mesh) else 'EMPTY'
+        self.parent = None
+        self.parent_type = 'OBJECT'
+        self.parent_bone = ""
+        self.matrix_parent_inverse = Matrix.Identity(4)
+        self.instance_collection = None
+        self.animation_data = None
+        self.modifiers = Modifiers()
+        self.constraints = []
+        self.vertex_groups = []
+        self.pose = None
+        self.location = Vector((0.0, 0.0, 0.0))
+        self.rotation_mode = 'XYZ'
+        self.rotation_euler = Euler((0.0, 0.0, 0.0))
+        self.rotation_quaternion = Quaternion((1.0, 0.0, 0.0, 0.0))
+        self.rotation_axis_angle = Vector((0.0, 0.0, 1.0, 0.0))
+        self.scale = Vector((1.0, 1.0, 1.0))
+        self.delta_location = Vector((0.0, 0.0, 0.0))
+        self.delta_rotation_euler = Vector((0.0, 0.0, 0.0))
+        self.delta_rotation_quaternion = Quaternion((1.0, 0.0, 0.0, 0.0))
+        self.delta_scale = Vector((1.0, 1.0, 1.0))
+        self.hide_viewport = False
+        self.show_in_front = False
+
+    @property
+    def matrix_world(self):
+        mat = np.identity(4, 'f')
+        mat[:3, 3] = self.location
+        return mat
+
+    def keyframe_insert(self, data_path, index=-1, frame=0):
+        if self.animation_data is None:
+            self.animation_data = AnimData()
+        if self.animation_data.action is None:
+            self.animation_data.action = data.actions.new(self.name + "Action")
+
+        for i in ([index] if index >= 0 else range(3)):
+            curves = self.animation_data.action.fcurves
+            fc = next((c for c in curves if c.data_path == data_path and c.array_index == i), None)
+            if fc is None:
+                fc = FCurve(data_path, i)
+                curves.append(fc)
+            fc.insert(frame, getattr(self, data_path)[i])
+
+    def path_resolve(self, path):
+        try:
+            return getattr(self, path)
+        except AttributeError:
+            raise ValueError(path)
+
+    def animate(self, frame):
+        """ Sets the keyed properties to their value on the frame, like a frame change does """
+        if self.animation_data is None or self.animation_data.action is None:
+            return
+        for fc in self.animation_data.action.fcurves:
+            getattr(self, fc.data_path)[fc.array_index] = fc.evaluate(frame)
+
+    def evaluated_get(self, depsgraph):
+        return self
+
+    def to_mesh(self):
+        """ The mesh deformed by its modifiers on the current frame, only Wave does anything """
+        vertices = self.data.co.copy()
+        frame = context.scene.frame_current
+        for mod in self.modifiers:
+            if mod.show_viewport and mod.type == 'WAVE':
+                vertices[:, 2] += np.sin(vertices[:, 0] * 4 + frame * 0.2) * 0.1
+        return Mesh(self.data.name, vertices, self.data.triangles)
+
+    def to_mesh_clear(self):
+        pass
+
+
+class DataCollection(dict):
+    """ Datablocks by name, iterating gives the datablocks like bpy.data collections do """
+
+    def __init__(self, kind):
+        super().__init__()
+        self.kind = kind
+
+    def __iter__(self):
+        return iter(list(self.values()))
+
+    def new(self, name, *args):
+        block = self.kind(name, *args)
+        self[name] = block
+        return block
+
+    def remove(self, block):
+        self.pop(block.name, None)
+
+
+class Scene(ID):
+    def __init__(self, name):
+        super().__init__(name)
+        self.frame_current = 1
+        self.collection = types.SimpleNamespace(objects=types.SimpleNamespace(link=lambda obj: None), children=dict([]))
+        self.objects = data.objects
+
+    def frame_set(self, frame):
+        self.frame_current = frame
+        for obj in data.objects:
+            obj.animate(frame)
+
+
+# ################ #
+# gpu and bgl      #
+# ################ #
+
+class GPUVertFormat:
+    def attr_add(self, **options):
+        pass
+
+
+class GPUVertBuf:
+    def __init__(self, format, count):
+        self.count = count
+        self.attributes = dict([])
+
+    def attr_fill(self, id, data):
+        self.attributes[id] = np.array(data, 'f').reshape(self.count, -1)
+
+    @property
+    def data(self):
+        return self.attributes["pos"]
+
+
+class GPUIndexBuf:
+    def __init__(self, type, seq):
+        self.data = np.array(seq, 'i')
+
+
+class GPUBatch:
+    def __init__(self, type, buf, elem=None):
+        self.type = type
+        self.buf = buf
+        self.elem = elem
+
+    def elements(self):
+        return len(self.buf.data) if self.elem is None else self.elem.data.size
+
+    def draw(self, shader):
+        self.draw_instanced(shader, 0, 1)
+
+    def draw_instanced(self, shader, instance_start=0, instance_count=1):
+        drawn["calls"] += 1
+        drawn["instances"] += instance_count
+        drawn["elements"] += self.elements() * instance_count
+
+
+class GPUShader:
+    def __init__(self, vertex, fragment):
+        self.uniforms = dict([])
+
+    def bind(self):
+        pass
+
+    def uniform_from_name(self, name):
+        return name
+
+    def uniform_vector_float(self, location, values, length, count):
+        self.uniforms[location] = np.array(values, 'f')
+
+    def uniform_int(self, name, value):
+        self.uniforms[name] = value
+
+
+class GPUOffScreen:
+    def __init__(self, width, height):
+        pass
+
+    @contextmanager
+    def bind(self):
+        yield
+
+    def free(self):
+        pass
+
+
+def reset_drawn():
+    drawn.update(calls=0, instances=0, elements=0)
+
+
+# ################ #
+# Modules          #
+# ################ #
+
+data = types.SimpleNamespace(
+    filepath="",
+    objects=DataCollection(Object),
+    meshes=DataCollection(Mesh),
+    actions=DataCollection(Action),
+    collections=DataCollection(ID),
+    scenes=DataCollection(Scene),
+    )
+
+context = types.SimpleNamespace(
+    scene=None,
+    view_layer=types.SimpleNamespace(objects=types.SimpleNamespace(active=None)),
+    window_manager=types.SimpleNamespace(windows=[]),
+    active_object=None,
+    selected_objects=[],
+    evaluated_depsgraph_get=lambda: None,
+    )
+
+
+def module(name, **attributes):
+    mod = types.ModuleType(name)
+    mod.__dict__.update(attributes)
+    return mod
+
+
+def install():
+    """ Puts the stand-ins in place of bpy, gpu, bgl and mathutils, returns False when Blender's own modules are there """
+    try:
+        import bpy
+        return getattr(bpy, "standin", False)
+    except ImportError:
+        pass
+
+    context.scene = data.scenes.new("Scene")
+
+    bpy_types = module("bpy.types", ID=ID, Object=Object, Action=Action, Mesh=Mesh, Operator=Operator, Panel=Panel,
+                       PropertyGroup=PropertyGroup, AddonPreferences=AddonPreferences, SpaceView3D=SpaceView3D)
+    handlers = module("bpy.app.handlers", persistent=lambda function: function)
+    timers = module("bpy.app.timers", register=lambda *args, **kw: None, unregister=lambda *args: None, is_registered=lambda *args: False)
+    app = module("bpy.app", version=(2, 93, 0), binary_path="", handlers=handlers, timers=timers)
+    props = module("bpy.props", **dict((name + "Property", prop_function(name)) for name in
+                                       ["Bool", "Int", "Float", "String", "Enum", "FloatVector", "Collection", "Pointer"]))
+    path = module("bpy.path", abspath=lambda p: p)
+    bpy = module("bpy", standin=True, types=bpy_types, app=app, props=props, path=path, data=data, context=context, ops=None)
+
+    gpu = module("gpu", types=module("gpu.types", GPUVertFormat=GPUVertFormat, GPUVertBuf=GPUVertBuf, GPUIndexBuf=GPUIndexBuf,
+                                     GPUBatch=GPUBatch, GPUShader=GPUShader, GPUOffScreen=GPUOffScreen),
+                 matrix=module("gpu.matrix", load_matrix=lambda m: None, load_projection_matrix=lambda m: None))
+    bgl = module("bgl", glEnable=lambda cap: None, glDisable=lambda cap: None, glPointSize=lambda size: None,
+                 GL_BLEND=0, GL_CULL_FACE=1, GL_DEPTH_TEST=2)
+    mathutils = module("mathutils", Vector=Vector, Matrix=Matrix, Euler=Euler, Quaternion=Quaternion)
+
+    sys.modules.update({
+        "bpy": bpy, "bpy.types": bpy_types, "bpy.app": app, "bpy.app.handlers": handlers, "bpy.app.timers": timers,
+        "bpy.props": props, "bpy.path": path, "gpu": gpu, "gpu.types": gpu.types, "gpu.matrix": gpu.matrix,
+        "bgl": bgl, "mathutils": mathutils,
+        })
+    return True
+
+
+def register(ops):
+    """ Gives the scene the add-on's properties, ops has to be imported after install() """
+    context.scene.anmx_data = ops.ANMX_data()